@@ -0,0 +1,102 @@
+"""
+ai_cache.py
+ذاكرة دائمة لنتائج التحقق بالذكاء الاصطناعي لكل زوج (منتجنا، منتج المنافس)
+نفس الزوج بنفس شريحة السعر لا يُرسل للذكاء الاصطناعي مرة أخرى
+"""
+
+import hashlib
+import json
+import math
+import threading
+import time
+
+import local_store
+from normalizer import normalize_name
+
+DEFAULT_TTL = 30 * 24 * 3600   # 30 يوماً
+DEFAULT_MAX_ENTRIES = 200_000
+PRICE_BUCKET_STEP = 1.05       # شرائح سعرية لوغاريتمية بعرض 5%
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_pair_cache (
+    pair_key TEXT PRIMARY KEY,
+    score REAL,
+    verdict_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ai_pair_cache_last_used ON ai_pair_cache (last_used);
+"""
+
+
+def _price_bucket(price):
+    try:
+        price = float(str(price).replace(",", ""))
+    except (TypeError, ValueError):
+        return -1
+    if price <= 0:
+        return 0
+    return int(math.log(price) / math.log(PRICE_BUCKET_STEP))
+
+
+def pair_key(my_name, comp_name, my_price, comp_price):
+    """مفتاح الزوج: الاسمان الموحدان + شريحة كل سعر"""
+    parts = [normalize_name(str(my_name)).canonical, normalize_name(str(comp_name)).canonical,
+             str(_price_bucket(my_price)), str(_price_bucket(comp_price))]
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class PairCache:
+    """ذاكرة SQLite مع مدة صلاحية (TTL) وحذف الأقل استخداماً (LRU)"""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.conn = local_store.connect(path)
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key):
+        """(الثقة, الحكم) أو None إذا لم يوجد أو انتهت صلاحيته"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT score, verdict_json, created_at FROM ai_pair_cache WHERE pair_key = ?",
+                                    (key,)).fetchone()
+            if row is None or now - row[2] > self.ttl:
+                self.stats["misses"] += 1
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE ai_pair_cache SET last_used = ? WHERE pair_key = ?", (now, key))
+            self.stats["hits"] += 1
+            return row[0], json.loads(row[1])
+
+    def put(self, key, score, verdict):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ai_pair_cache (pair_key, score, verdict_json, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, score, json.dumps(verdict, ensure_ascii=False), now, now))
+
+    def evict(self):
+        """حذف المنتهية صلاحيتها ثم الأقل استخداماً فوق الحد الأقصى"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM ai_pair_cache WHERE created_at < ?", (time.time() - self.ttl,))
+            self.conn.execute(
+                "DELETE FROM ai_pair_cache WHERE pair_key IN ("
+                "SELECT pair_key FROM ai_pair_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+
+
+_pair_cache = None
+_pair_cache_lock = threading.Lock()
+
+
+def get_pair_cache():
+    """نسخة واحدة مشتركة لكل عملية"""
+    global _pair_cache
+    with _pair_cache_lock:
+        if _pair_cache is None:
+            _pair_cache = PairCache()
+        return _pair_cache
@@ -0,0 +1,155 @@
+"""
+ai_pipeline.py
+مرحلة تحقق بالذكاء الاصطناعي متزامنة مع المطابقة: طابور محدود + عمال (threads)
+مع حد طلبات بالدقيقة (token bucket) وحد تزامن لكل مزود
+"""
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_RPM = int(os.environ.get("AI_RPM", "60"))
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", "4"))
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 8   # عدد الدفعات المنتظرة قبل أن تتوقف المطابقة (ضغط عكسي)
+
+
+class TokenBucket:
+    """حد طلبات بالدقيقة: رصيد يمتلئ بمعدل ثابت حتى السعة القصوى"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1, rate_per_minute // 6)  # دفقة بحجم 10 ثوانٍ
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """الانتظار حتى يتوفر الرصيد ثم خصمه"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate if self.rate > 0 else 1.0
+            time.sleep(min(wait, 1.0))
+
+
+class ProviderLimiter:
+    """حد الطلبات بالدقيقة + عدد الطلبات المتزامنة لمزود واحد"""
+
+    def __init__(self, rpm=DEFAULT_RPM, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.bucket = TokenBucket(rpm)
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    @contextmanager
+    def slot(self):
+        with self.semaphore:
+            self.bucket.acquire()
+            yield
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_provider(name, rpm=DEFAULT_RPM, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """ضبط حدود مزود (openrouter / gemini ...) لكل العملية"""
+    with _limiters_lock:
+        _limiters[name] = ProviderLimiter(rpm, max_concurrency)
+        return _limiters[name]
+
+
+def provider_slot(name):
+    """with provider_slot("openrouter"): ... حول كل طلب HTTP للمزود"""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = ProviderLimiter()
+    return limiter.slot()
+
+
+_STOP = object()
+
+
+class VerificationPipeline:
+    """تحقق متزامن: المطابقة تضيف الأزواج بـ submit() وتستمر، والعمال يرسلون الدفعات في الخلفية.
+
+    verify_batch(pairs) -> {id: الحكم} (مثل engine_v15.verify_pairs_batch)
+    الأحكام تُجمع بـ close() (أو عند الخروج من with) وتُدمج في صفوف النتائج.
+    """
+
+    def __init__(self, verify_batch, batch_size=20, workers=DEFAULT_WORKERS, max_queue=DEFAULT_QUEUE_SIZE,
+                 profiler=None):
+        self.verify_batch = verify_batch
+        self.profiler = profiler
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.verdicts = {}
+        self.errors = 0
+        self.submit_wait = 0.0   # ثوانٍ قضتها submit() منتظرة مكاناً في الطابور الممتلئ
+        self.lock = threading.Lock()
+        self.pending = []
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, workers))]
+        for t in self.threads:
+            t.start()
+
+    def _worker(self):
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is _STOP:
+                    return
+                start = time.perf_counter()
+                try:
+                    verdicts = self.verify_batch(batch)
+                except Exception:
+                    verdicts = {}
+                    with self.lock:
+                        self.errors += 1
+                if self.profiler:
+                    self.profiler.add("ai_verify", time.perf_counter() - start, items=len(batch))
+                with self.lock:
+                    self.verdicts.update(verdicts)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, pair):
+        """إضافة زوج؛ تتوقف مؤقتاً فقط إذا امتلأ الطابور (زمن التوقف في submit_wait ومرحلة ai_backpressure)"""
+        self.pending.append(pair)
+        if len(self.pending) >= self.batch_size:
+            items = len(self.pending)
+            start = time.perf_counter()
+            self.flush()
+            waited = time.perf_counter() - start
+            self.submit_wait += waited
+            if self.profiler:
+                self.profiler.add("ai_backpressure", waited, items=items)
+
+    def flush(self):
+        if self.pending:
+            self.queue.put(self.pending)
+            self.pending = []
+
+    def close(self):
+        """انتظار انتهاء كل الدفعات وإعادة {id: الحكم}"""
+        self.flush()
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for t in self.threads:
+            t.join()
+        return self.verdicts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,197 @@
+"""
+ai_router.py
+توجيه طلبات الذكاء الاصطناعي بين المزودين (Gemini / OpenRouter) مع قياس زمن الاستجابة
+إذا تأخر المزود الأساسي عن p95 الخاص به يُرسل طلب احتياطي للمزود الثاني ويُؤخذ أول رد ناجح
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+WINDOW = 200          # عدد آخر الطلبات المحفوظة لكل مزود
+MIN_SAMPLES = 10      # أقل عدد عينات قبل الاعتماد على p95 ونسبة الأخطاء
+MIN_HEDGE_DELAY = 0.5
+MAX_ERROR_RATE = 0.5  # فوقها يُقدَّم المزود الثاني على الأساسي
+HEDGE_TIMEOUT_SHARE = 0.6  # الطلب الاحتياطي ينطلق قبل 60% من مهلة الطلب (timeout) على الأكثر
+
+
+class ProviderStats:
+    """زمن الاستجابة (الناجحة) ونسبة الأخطاء لآخر WINDOW طلب"""
+
+    def __init__(self, window=WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds, success):
+        with self.lock:
+            self.outcomes.append(bool(success))
+            if success:
+                self.latencies.append(seconds)
+
+    def percentile(self, q):
+        with self.lock:
+            values = sorted(self.latencies)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+    def error_rate(self):
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def report(self):
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "requests": len(self.outcomes),
+            "p50": round(p50, 2) if p50 is not None else None,
+            "p95": round(p95, 2) if p95 is not None else None,
+            "error_rate": round(self.error_rate() * 100, 1),
+        }
+
+
+@dataclass
+class SiteConfig:
+    """إعدادات موضع استدعاء (chat / bulk / verify)"""
+    order: list = field(default_factory=lambda: ["gemini", "openrouter"])
+    hedge: bool = True
+    default_delay: float = 8.0   # مهلة الطلب الاحتياطي قبل توفر عينات كافية
+
+
+SITES = {
+    "chat": SiteConfig(["gemini", "openrouter"], hedge=True, default_delay=8.0),
+    "bulk": SiteConfig(["gemini", "openrouter"], hedge=True, default_delay=20.0),
+    "verify": SiteConfig(["openrouter", "gemini"], hedge=True, default_delay=3.0),
+}
+
+
+class AIRouter:
+    """مزود = دالة (prompt, **kwargs) -> {"success", "text"} أو {"success": False, "error"}"""
+
+    def __init__(self, max_workers=8):
+        self.providers = {}
+        self.stats = {}
+        self.sites = {name: SiteConfig(list(c.order), c.hedge, c.default_delay) for name, c in SITES.items()}
+        self.lock = threading.Lock()
+        self.max_workers = max_workers
+        self.running = 0  # طلبات تشغل خيطاً الآن (منها الخاسرة التي تنتظر مهلتها)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-router")
+
+    def register(self, name, fn):
+        with self.lock:
+            self.providers[name] = fn
+            self.stats.setdefault(name, ProviderStats())
+
+    def configure(self, site, **options):
+        with self.lock:
+            config = self.sites.setdefault(site, SiteConfig())
+            for key, value in options.items():
+                setattr(config, key, value)
+
+    def _stats(self, name):
+        with self.lock:
+            return self.stats.setdefault(name, ProviderStats())
+
+    def hedge_delay(self, name, config, timeout=None):
+        """p95 للمزود (أو default_delay)، وأقل دائماً من مهلة الطلب وإلا لن ينطلق الاحتياطي قبل فشل الأساسي"""
+        stats = self._stats(name)
+        p95 = stats.percentile(95) if len(stats.outcomes) >= MIN_SAMPLES else None
+        delay = max(MIN_HEDGE_DELAY, p95 if p95 is not None else config.default_delay)
+        if timeout:
+            delay = min(delay, timeout * HEDGE_TIMEOUT_SHARE)
+        return delay
+
+    def _has_free_worker(self):
+        with self.lock:
+            return self.running < self.max_workers
+
+    def _ordered(self, config, providers):
+        """المزودون المتاحون بترتيب الموضع، مع تأخير المزود كثير الأخطاء"""
+        chain = [(name, providers[name]) for name in config.order if name in providers]
+
+        def unhealthy(item):
+            stats = self._stats(item[0])
+            return len(stats.outcomes) >= MIN_SAMPLES and stats.error_rate() > MAX_ERROR_RATE
+        return sorted(chain, key=unhealthy)  # sorted ثابت: الترتيب الأصلي يبقى بين الأصحاء
+
+    def _timed(self, name, fn, prompt, kwargs):
+        with self.lock:
+            self.running += 1
+        start = time.monotonic()
+        try:
+            result = fn(prompt, **kwargs)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        finally:
+            with self.lock:
+                self.running -= 1
+        self._stats(name).record(time.monotonic() - start, result.get("success"))
+        return result
+
+    def call(self, prompt, site="chat", providers=None, **kwargs):
+        """أول رد ناجح؛ providers يتجاوز المزودين المسجلين (مثلاً بمفاتيح الجلسة)
+
+        الطلب الخاسر لا يمكن إيقافه أثناء التنفيذ: يُلغى إن لم يبدأ بعد، وإلا يحرر خيطه عند مهلته (timeout)،
+        ولا يُرسل طلب احتياطي إذا كانت كل خيوط الموجّه مشغولة (كان سينتظر في الطابور فقط).
+        """
+        config = self.sites.get(site) or SiteConfig()
+        with self.lock:
+            available = dict(self.providers)
+        available.update(providers or {})
+        chain = self._ordered(config, available)
+        if not chain:
+            return {"success": False, "error": "لا يوجد مزود ذكاء اصطناعي مهيأ"}
+
+        futures = {}
+        hedged = waited = False  # waited: مهلة التحوط انقضت مرة (أُرسل الاحتياطي أو لا خيط متاح له)
+
+        def launch(name, fn):
+            futures[self.executor.submit(self._timed, name, fn, prompt, kwargs)] = name
+
+        launch(*chain.pop(0))
+        last = {"success": False, "error": "فشلت كل المحاولات"}
+        while futures:
+            timeout = None
+            if config.hedge and chain and not waited:
+                timeout = self.hedge_delay(next(iter(futures.values())), config, kwargs.get("timeout"))
+            done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                waited = True
+                if self._has_free_worker():
+                    # الأساسي تجاوز p95: طلب احتياطي للمزود التالي
+                    launch(*chain.pop(0))
+                    hedged = True
+                continue
+            for future in done:
+                name = futures.pop(future)
+                result = future.result()
+                if result.get("success"):
+                    for loser in futures:
+                        loser.cancel()
+                    return {**result, "provider": name, "hedged": hedged}
+                last = result
+            if not futures and chain:
+                launch(*chain.pop(0))  # فشل سريع: الانتقال للمزود التالي فوراً
+        return last
+
+    def report(self):
+        with self.lock:
+            names = list(self.stats)
+        return {name: self._stats(name).report() for name in names}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """موجّه واحد مشترك لكل العملية (الإحصائيات مشتركة بين الجلسات)"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = AIRouter()
+        return _router
@@ -0,0 +1,107 @@
+"""
+aimd.py
+تحكم تكيّفي (AIMD) في عدد الطلبات المتزامنة وحجم الدفعة لإرسال Make.com:
+زيادة جمعية ما دامت الردود سريعة وناجحة، وتخفيض ضربي عند 429/5xx أو قفزة في زمن الاستجابة
+مع معدل إنتاجية حي (منتج/ثانية)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+MAX_CONCURRENCY = int(os.environ.get("WEBHOOK_MAX_CONCURRENCY", "16"))
+MAX_BATCH = int(os.environ.get("WEBHOOK_MAX_BATCH", "200"))
+LATENCY_LIMIT = 10.0     # ثوانٍ: أي رد أبطأ من هذا يُعد قفزة مهما كان المتوسط
+SPIKE_FACTOR = 3.0       # أو أبطأ من 3× متوسط الردود الأخيرة
+RATE_WINDOW = 10.0       # نافذة حساب منتج/ثانية
+
+
+class AIMDController:
+    """حدود الإرسال الحالية مشتركة بين كل العمال: concurrency (طلبات متزامنة) و batch_size (منتجات/طلب)"""
+
+    def __init__(self, min_concurrency=1, max_concurrency=MAX_CONCURRENCY, concurrency=2,
+                 min_batch=10, max_batch=MAX_BATCH, batch_size=50, batch_step=10, decrease=0.5,
+                 latency_limit=LATENCY_LIMIT, spike_factor=SPIKE_FACTOR):
+        self.min_concurrency, self.max_concurrency = min_concurrency, max_concurrency
+        self.min_batch, self.max_batch = min_batch, max_batch
+        self.concurrency = float(concurrency)
+        self.batch = float(batch_size)
+        self.batch_step = batch_step
+        self.decrease = decrease
+        self.latency_limit = latency_limit
+        self.spike_factor = spike_factor
+        self.latency_avg = None
+        self.inflight = 0
+        self.cooldown_until = 0.0
+        self.paused_until = 0.0         # Retry-After: لا طلبات جديدة قبل هذا الوقت
+        self.sent = deque()            # (وقت، عدد المنتجات) للنافذة الأخيرة
+        self.condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return max(self.min_concurrency, min(self.max_concurrency, int(self.concurrency)))
+
+    @property
+    def batch_size(self):
+        return max(self.min_batch, min(self.max_batch, int(self.batch)))
+
+    @contextmanager
+    def slot(self):
+        """الانتظار حتى يقل عدد الطلبات الجارية عن الحد الحالي وتنتهي مهلة Retry-After"""
+        with self.condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self.inflight < self.limit:
+                    break
+                self.condition.wait(pause if pause > 0 else None)
+            self.inflight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.inflight -= 1
+                self.condition.notify_all()
+
+    def _is_spike(self, latency):
+        if latency > self.latency_limit:
+            return True
+        return self.latency_avg is not None and latency > self.spike_factor * self.latency_avg
+
+    def record(self, ok, latency, items=0, throttled=False, retry_after=None):
+        """نتيجة طلب واحد: throttled = 429/5xx/انقطاع (رفض مؤقت من الخادم)"""
+        now = time.monotonic()
+        with self.condition:
+            if throttled and retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            if ok:
+                self.sent.append((now, items))
+            if throttled or (ok and self._is_spike(latency)):
+                # تخفيض ضربي مرة واحدة لكل فترة تهدئة (الطلبات الجارية وقت الرفض لا تخفض مرة أخرى)
+                if now >= self.cooldown_until:
+                    self.concurrency = max(self.min_concurrency, self.concurrency * self.decrease)
+                    self.batch = max(self.min_batch, self.batch * self.decrease)
+                    self.cooldown_until = now + max(latency, 1.0)
+            elif ok:
+                # زيادة جمعية: +1 تزامن و +batch_step منتج تقريباً كل «نافذة» من الطلبات الناجحة
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / self.limit)
+                self.batch = min(self.max_batch, self.batch + self.batch_step / self.limit)
+                self.latency_avg = latency if self.latency_avg is None else 0.8 * self.latency_avg + 0.2 * latency
+            self.condition.notify_all()
+
+    def rate(self):
+        """منتج/ثانية خلال آخر RATE_WINDOW ثانية"""
+        now = time.monotonic()
+        with self.condition:
+            while self.sent and now - self.sent[0][0] > RATE_WINDOW:
+                self.sent.popleft()
+            if not self.sent:
+                return 0.0
+            span = max(now - self.sent[0][0], 1.0)
+            return round(sum(n for _, n in self.sent) / span, 1)
+
+    def snapshot(self):
+        return {"concurrency": self.limit, "batch_size": self.batch_size, "inflight": self.inflight,
+                "rate": self.rate(),
+                "latency_avg": round(self.latency_avg, 2) if self.latency_avg is not None else None}
@@ -0,0 +1,131 @@
+"""
+catalog.py
+مولّد كتالوجات عطور اصطناعية (عربي/إنجليزي) قابلة للتكرار بنفس البذرة (seed)
+كتالوج المتجر + ملفات منافسين بنفس المنتجات بصيغ مختلفة وأخطاء إملائية وأسعار متفاوتة
+"""
+
+import random
+
+import pandas as pd
+
+# (الإنجليزي، العربي)
+BRANDS = [
+    ("Dior", "ديور"), ("Chanel", "شانيل"), ("Tom Ford", "توم فورد"), ("Guerlain", "جيرلان"),
+    ("Yves Saint Laurent", "ايف سان لوران"), ("Giorgio Armani", "جورجيو ارماني"), ("Versace", "فيرساتشي"),
+    ("Prada", "برادا"), ("Gucci", "غوتشي"), ("Hermes", "هيرميس"), ("Creed", "كريد"), ("Amouage", "امواج"),
+    ("Lancome", "لانكوم"), ("Givenchy", "جيفنشي"), ("Burberry", "بربري"), ("Montblanc", "مونت بلانك"),
+    ("Jo Malone", "جو مالون"), ("Kilian", "كيليان"), ("Xerjoff", "زيرجوف"), ("Initio", "انيشيو"),
+    ("Parfums de Marly", "بارفيوم دي مارلي"), ("Maison Francis Kurkdjian", "ميزون فرانسيس كوركدجيان"),
+    ("Narciso Rodriguez", "نارسيسو رودريغز"), ("Carolina Herrera", "كارولينا هيريرا"), ("Valentino", "فالنتينو"),
+    ("Lattafa", "لطافة"), ("Rasasi", "الرصاصي"), ("Ajmal", "اجمل"), ("Arabian Oud", "العربية للعود"),
+    ("Abdul Samad Al Qurashi", "عبدالصمد القرشي"),
+]
+
+LINE_WORDS = [
+    "Sauvage", "Bleu", "Oud", "Noir", "Rose", "Amber", "Musk", "Velvet", "Royal", "Intense", "Night", "Gold",
+    "Silver", "Wood", "Leather", "Vanilla", "Santal", "Black", "White", "Elixir", "Imperial", "Aqua", "Sport",
+    "Orchid", "Jasmine", "Saffron", "Tobacco", "Iris", "Cedar", "Mystic", "Desert", "Pearl", "Legend",
+]
+
+# (الرمز، الصيغ الممكنة في أسماء المنتجات)
+CONCENTRATIONS = [
+    ("edp", ["EDP", "Eau de Parfum", "او دو بارفيوم", "ماء العطر"]),
+    ("edt", ["EDT", "Eau de Toilette", "او دو تواليت"]),
+    ("parfum", ["Parfum", "بارفيوم"]),
+    ("extrait", ["Extrait de Parfum", "اكستريت"]),
+]
+
+SIZES_ML = [30, 50, 75, 90, 100, 125, 150, 200]
+OZ_BY_ML = {30: "1oz", 50: "1.7oz", 100: "3.4oz", 125: "4.2oz", 150: "5oz", 200: "6.7oz"}
+
+
+def _typo(rng, text):
+    """خطأ إملائي واحد: حذف أو تكرار أو تبديل حرفين متجاورين"""
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 2)
+    kind = rng.random()
+    if kind < 0.4:
+        return text[:i] + text[i + 1:]
+    if kind < 0.7:
+        return text[:i] + text[i] + text[i:]
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+def generate_products(n, seed=42):
+    """منتجات أساسية: ماركة + خط + تركيز + حجم + تستر + سعر"""
+    rng = random.Random(seed)
+    products = []
+    for i in range(n):
+        brand = rng.choice(BRANDS)
+        line = " ".join(rng.sample(LINE_WORDS, rng.choice([1, 2, 2, 3])))
+        code, forms = rng.choice(CONCENTRATIONS)
+        products.append({
+            "brand": brand,
+            "line": line,
+            "concentration": code,
+            "concentration_forms": forms,
+            "size_ml": rng.choice(SIZES_ML),
+            "is_tester": rng.random() < 0.08,
+            "price": round(rng.uniform(80, 1500), 2),
+            "sku": f"SKU-{seed}-{i:07d}",
+        })
+    return products
+
+
+def render_name(product, rng, arabic=False, noisy=False):
+    """اسم المنتج كما يكتبه متجر معين: لغة الماركة، صيغة التركيز والحجم، ترتيب الكلمات، أخطاء"""
+    brand = product["brand"][1] if arabic else product["brand"][0]
+    concentration = rng.choice(product["concentration_forms"]) if noisy else product["concentration_forms"][0]
+    size = product["size_ml"]
+    if noisy and size in OZ_BY_ML and rng.random() < 0.2:
+        size_text = OZ_BY_ML[size]
+    elif noisy and rng.random() < 0.4:
+        size_text = f"{size} مل"
+    else:
+        size_text = f"{size}ml"
+
+    parts = [brand, product["line"], concentration, size_text]
+    if noisy and rng.random() < 0.3:
+        parts = [product["line"], brand, concentration, size_text]
+    if product["is_tester"]:
+        parts.append("تستر" if arabic else "Tester")
+    if noisy and rng.random() < 0.25:
+        parts.insert(0, "عطر" if arabic else "Perfume")
+    name = " ".join(parts)
+    if noisy and rng.random() < 0.2:
+        name = _typo(rng, name)
+    return name
+
+
+def store_catalog(products, seed=42):
+    """كتالوج المتجر: أسماء نظيفة بأعمدة name / price / sku"""
+    rng = random.Random(seed + 1)
+    return pd.DataFrame({
+        "name": [render_name(p, rng, arabic=rng.random() < 0.5) for p in products],
+        "price": [p["price"] for p in products],
+        "sku": [p["sku"] for p in products],
+    })
+
+
+def competitor_catalog(products, rows, competitor_no, seed=42, overlap=0.7):
+    """ملف منافس: overlap من صفوفه منتجات المتجر بصيغ مختلفة، والباقي منتجات غير موجودة لدينا"""
+    rng = random.Random(seed * 1000 + competitor_no)
+    shared = int(rows * overlap)
+    picked = [rng.choice(products) for _ in range(shared)]
+    others = generate_products(rows - shared, seed=seed * 1000 + competitor_no + 500)
+    names, prices = [], []
+    for p in picked + others:
+        names.append(render_name(p, rng, arabic=rng.random() < 0.5, noisy=True))
+        prices.append(round(p["price"] * rng.uniform(0.8, 1.2), 2))
+    order = list(range(len(names)))
+    rng.shuffle(order)
+    return pd.DataFrame({"name": [names[i] for i in order], "price": [prices[i] for i in order]})
+
+
+def generate(rows, competitors=1, comp_rows=None, seed=42):
+    """(كتالوج المتجر، [ملفات المنافسين]) لحجم وعدد منافسين محددين"""
+    products = generate_products(rows, seed=seed)
+    comp_rows = comp_rows or rows
+    return store_catalog(products, seed), [competitor_catalog(products, comp_rows, c, seed)
+                                           for c in range(competitors)]
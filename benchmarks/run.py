@@ -0,0 +1,208 @@
+"""
+run.py
+قياس أداء محركات المطابقة على كتالوجات اصطناعية (الذكاء الاصطناعي وSupabase معطّلان ببدائل محلية)
+
+    python benchmarks/run.py --rows 1000 10000 --competitors 1 5 30 --engines full multi super
+
+النتيجة (صف/ثانية، زمن كل مرحلة، ذروة الذاكرة) تُكتب كـ JSON في benchmarks/results/ للمقارنة بين التشغيلات.
+
+كل حالة تعمل في عملية مستقلة (spawn) فتخصها أرقام الذاكرة وحدها:
+peak_rss_mb ذروة RSS لعملية الحالة، peak_rss_workers_mb ذروة أكبر عامل ProcessPool (وضع multi)،
+peak_python_main_mb تخصيصات بايثون في العملية الرئيسية فقط (tracemalloc لا يرى العمال).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from functools import partial
+
+try:
+    import resource  # غير متوفر على Windows
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+import catalog  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+ENGINES = ("full", "multi", "super")
+
+
+class NullDatabase:
+    """بديل DatabaseManager: يعدّ عمليات الحفظ دون اتصال بـ Supabase"""
+
+    saves = 0
+
+    def __init__(self):
+        self.active = False
+
+    def get_session_id(self):
+        return "benchmark"
+
+    def save_match(self, my_prod, comp_prod, res):
+        NullDatabase.saves += 1
+
+    def flush(self):
+        return 0
+
+    def close(self):
+        return None
+
+
+def stub_ai_chat(prompt, timeout=5, response_format=None, latency=0.0):
+    """بديل الذكاء الاصطناعي: يقبل كل الأزواج بعد زمن استجابة ثابت"""
+    if latency:
+        time.sleep(latency)
+    if response_format:
+        items = json.loads(re.search(r"^\[.*\]$", prompt, re.M).group(0))
+        return json.dumps({"verdicts": [{"id": it["id"], "is_match": True, "reason": "stub"} for it in items]})
+    return json.dumps({"is_match": True, "reason": "stub"})
+
+
+def isolate_state(tmp_dir):
+    """كل الحالة المحلية (ذاكرات مؤقتة، نقاط استئناف، فهارس) في مجلد مؤقت ليكون القياس باردًا
+
+    LOCAL_STORE_DIR يصل أيضاً إلى عمال ProcessPool المنشأة بـ spawn (تعديل المتغيرات أدناه لا يصلهم)
+    """
+    os.environ["LOCAL_STORE_DIR"] = tmp_dir
+    import ai_cache
+    import final_engine
+    import local_store
+    import upload_cache
+
+    local_store.DB_PATH = os.path.join(tmp_dir, "local_store.db")
+    upload_cache.UPLOAD_CACHE_DIR = os.path.join(tmp_dir, "uploads")
+    ai_cache._pair_cache = None
+    final_engine.get_or_build_index = partial(final_engine.get_or_build_index,
+                                              cache_dir=os.path.join(tmp_dir, "token_index"))
+
+
+def run_case(engine, store_df, comp_dfs, tmp_dir, threshold, ai_latency):
+    import engine_v15
+    import final_engine
+
+    engine_v15._ai_chat = partial(stub_ai_chat, latency=ai_latency)
+    engine_v15.DatabaseManager = NullDatabase
+    final_engine.DatabaseManager = NullDatabase
+    NullDatabase.saves = 0
+
+    comp_rows = sum(len(df) for df in comp_dfs)
+    if engine == "multi":
+        comp_input = []
+        for n, df in enumerate(comp_dfs):
+            path = os.path.join(tmp_dir, f"competitor_{n}.csv")
+            df.to_csv(path, index=False)
+            comp_input.append({"name": f"competitor_{n}.csv", "path": path})
+    else:
+        comp_input = pd.concat(comp_dfs, ignore_index=True)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        if engine == "super":
+            result = final_engine.run_super_analysis(store_df, comp_input, threshold=threshold)
+        else:
+            result = engine_v15.run_full_analysis(store_df, comp_input, threshold=threshold)
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "engine": engine,
+        "rows": len(store_df),
+        "competitors": len(comp_dfs),
+        "competitor_rows": comp_rows,
+        "matched": len(result),
+        "saves": NullDatabase.saves,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(len(store_df) / elapsed, 1) if elapsed else None,
+        # زمن كل مرحلة من ملخص أداء المحرك نفسه (df.attrs["profile"])
+        "stages": {s["stage"]: s["seconds"] for s in result.attrs.get("profile", {}).get("stages", [])},
+        "peak_python_main_mb": round(peak / 1024 / 1024, 1),
+        "peak_rss_mb": _max_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        "peak_rss_workers_mb": _max_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+
+def _max_rss_mb(who):
+    """ru_maxrss بالميغابايت (كيلوبايت على Linux، بايت على macOS)"""
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _case_process(queue, engine, rows, competitors, args):
+    """حالة واحدة في عملية جديدة: ru_maxrss للعملية وعمالها يخص هذه الحالة فقط"""
+    try:
+        store_df, comp_dfs = catalog.generate(rows, competitors, args.comp_rows, seed=args.seed)
+        with tempfile.TemporaryDirectory(prefix="bench_") as tmp_dir:
+            isolate_state(tmp_dir)
+            queue.put(run_case(engine, store_df, comp_dfs, tmp_dir, args.threshold, args.ai_latency))
+    except Exception as e:
+        queue.put({"engine": engine, "rows": rows, "competitors": competitors, "error": f"{type(e).__name__}: {e}"})
+
+
+def run_isolated(engine, rows, competitors, args):
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_case_process, args=(queue, engine, rows, competitors, args))
+    proc.start()
+    case = queue.get()
+    proc.join()
+    return case
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="قياس أداء محركات المطابقة")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000], help="عدد منتجات المتجر (مثل 1000 10000 100000)")
+    parser.add_argument("--competitors", type=int, nargs="+", default=[1, 5], help="عدد ملفات المنافسين (1-30)")
+    parser.add_argument("--comp-rows", type=int, default=None, help="صفوف كل منافس (الافتراضي = rows)")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--threshold", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ai-latency", type=float, default=0.0, help="زمن استجابة بديل الذكاء الاصطناعي بالثواني")
+    parser.add_argument("--output", default=None, help="ملف JSON للنتائج")
+    args = parser.parse_args(argv)
+
+    cases = []
+    for rows in args.rows:
+        for competitors in args.competitors:
+            for engine in args.engines:
+                case = run_isolated(engine, rows, competitors, args)
+                cases.append(case)
+                if "error" in case:
+                    print(f"{engine:>5} | {rows:>7} صف × {competitors:>2} منافس | ❌ {case['error']}")
+                    continue
+                print(f"{engine:>5} | {rows:>7} صف × {competitors:>2} منافس | {case['rows_per_sec']:>9} صف/ث | "
+                      f"{case['seconds']:>8}ث | RSS {case['peak_rss_mb']}MB (عمال {case['peak_rss_workers_mb']}MB، "
+                      f"بايثون الرئيسية {case['peak_python_main_mb']}MB) | {case['stages']}")
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "cases": cases,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+webhook.py
+قياس إرسال Make.com عبر webhook_outbox مقابل webhook محلي بديل يحاكي الخنق (429) وبطء الدفعات الكبيرة
+
+    python benchmarks/webhook.py --products 5000 --capacity 400 --max-inflight 6
+
+يقارن الإرسال الثابت القديم (طلب واحد في كل مرة، 50 منتجاً) بالمتحكم التكيّفي AIMD؛
+النتيجة (منتج/ثانية، عدد 429، مسار التزامن وحجم الدفعة) تُكتب كـ JSON في benchmarks/results/.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aimd import AIMDController  # noqa: E402
+from webhook_outbox import Outbox  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+class StubWebhook:
+    """webhook محلي: زمن رد = base + per_item × المنتجات، و429 عند تجاوز الطلبات المتزامنة أو سعة منتج/ثانية"""
+
+    def __init__(self, capacity=400, max_inflight=6, base_latency=0.05, per_item=0.002):
+        self.capacity = capacity
+        self.max_inflight = max_inflight
+        self.base_latency = base_latency
+        self.per_item = per_item
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.inflight = 0
+        self.accepted = 0
+        self.throttled = 0
+        self.keys = set()
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                items = len(body.get("products", body.get("data", [])))
+                if not stub._admit(items, self.headers.get("Idempotency-Key")):
+                    self.send_response(429)
+                    self.send_header("Retry-After", "1")
+                    self.end_headers()
+                    return
+                try:
+                    time.sleep(stub.base_latency + stub.per_item * items)
+                    self.send_response(200)
+                    self.end_headers()
+                    self.wfile.write(b"Accepted")
+                finally:
+                    with stub.lock:
+                        stub.inflight -= 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _admit(self, items, key):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity)
+            self.updated = now
+            if self.inflight >= self.max_inflight or self.tokens < items:
+                self.throttled += 1
+                return False
+            self.tokens -= items
+            self.inflight += 1
+            if key not in self.keys:
+                self.keys.add(key)
+                self.accepted += items
+            return True
+
+    def close(self):
+        self.server.shutdown()
+
+
+def run_case(name, products, stub_args, controller):
+    stub = StubWebhook(**stub_args)
+    trace = []
+    with tempfile.TemporaryDirectory(prefix="bench_webhook_") as tmp_dir:
+        box = Outbox(path=os.path.join(tmp_dir, "outbox.db"), controller=controller,
+                     workers=controller.max_concurrency)
+        box.register_target("stub", lambda items: {"products": items})
+        box.start()
+        start = time.perf_counter()
+        job_id = box.enqueue("bench", name, "stub", stub.url, [{"id": i} for i in range(products)])
+        while True:
+            status = box.wait(job_id, 0.5)
+            trace.append({"t": round(time.perf_counter() - start, 1), "sent": status["sent"], **box.snapshot()})
+            if status["done"]:
+                break
+        elapsed = time.perf_counter() - start
+    stub.close()
+    return {
+        "case": name,
+        "products": products,
+        "seconds": round(elapsed, 2),
+        "products_per_sec": round(status["sent"] / elapsed, 1),
+        "sent": status["sent"],
+        "failed": status["failed"],
+        "accepted_unique": stub.accepted,
+        "throttled": stub.throttled,
+        "requests": status["batches"],
+        "trace": trace,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="قياس إرسال Make.com (ثابت مقابل AIMD)")
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--capacity", type=int, default=400, help="سعة الـ webhook البديل (منتج/ثانية)")
+    parser.add_argument("--max-inflight", type=int, default=6, help="أقصى طلبات متزامنة قبل 429")
+    parser.add_argument("--base-latency", type=float, default=0.05)
+    parser.add_argument("--per-item", type=float, default=0.002)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    stub_args = {"capacity": args.capacity, "max_inflight": args.max_inflight,
+                 "base_latency": args.base_latency, "per_item": args.per_item}
+    cases = [
+        # السلوك القديم: دفعة 50 ثابتة وطلب واحد في كل مرة
+        run_case("fixed", args.products, stub_args,
+                 AIMDController(min_concurrency=1, max_concurrency=1, concurrency=1,
+                                min_batch=50, max_batch=50, batch_size=50)),
+        run_case("aimd", args.products, stub_args, AIMDController()),
+    ]
+    for case in cases:
+        last = case["trace"][-1]
+        print(f"{case['case']:>6} | {case['products_per_sec']:>8} منتج/ث | {case['seconds']:>7}ث | "
+              f"{case['requests']} طلب | 429×{case['throttled']} | تزامن {last['concurrency']} دفعة {last['batch_size']}")
+
+    report = {"created_at": datetime.now().isoformat(timespec="seconds"), "args": vars(args), "cases": cases}
+    output = args.output or os.path.join(RESULTS_DIR, f"webhook_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 {output}")
+
+
+if __name__ == "__main__":
+    main()
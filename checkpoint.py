@@ -0,0 +1,91 @@
+"""
+checkpoint.py
+نقاط استئناف محلية لـ run_super_analysis: تُحفظ كل دفعة مكتملة مع نتائجها
+تكلفة الحفظ مرة واحدة لكل دفعة وليس لكل منتج
+"""
+
+import hashlib
+import json
+import time
+
+import pandas as pd
+
+import local_store
+
+MAX_AGE = 7 * 86400   # تشغيل متوقف لم تُحفظ له دفعة منذ 7 أيام يُحذف
+MAX_RUNS = 5          # وأقصى عدد تشغيلات غير مكتملة محفوظة (الأحدث نشاطاً)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoint_chunks (
+    run_key TEXT NOT NULL,
+    chunk_no INTEGER NOT NULL,
+    results_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (run_key, chunk_no)
+);
+"""
+
+
+def _json_default(obj):
+    return obj.item() if hasattr(obj, "item") else str(obj)
+
+
+def _frame_digest(df):
+    """بصمة محتوى DataFrame (القيم + أسماء الأعمدة)"""
+    digest = hashlib.sha1(json.dumps([str(c) for c in df.columns], ensure_ascii=False).encode("utf-8"))
+    try:
+        digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    except TypeError:
+        # أعمدة بقيم غير قابلة للبصمة المباشرة (قوائم مثلاً)
+        digest.update(df.astype(str).to_csv(index=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CheckpointStore:
+    """الدفعات المكتملة لتشغيل واحد محدد بمدخلاته"""
+
+    def __init__(self, run_key, path=None):
+        self.run_key = run_key
+        self.conn = local_store.connect(path)
+        self.conn.executescript(_SCHEMA)
+        self.evict()
+
+    @staticmethod
+    def make_run_key(my_df, comp_df, chunk_size, **params):
+        """مفتاح التشغيل: نفس الملفات والإعدادات = نفس المفتاح"""
+        parts = [_frame_digest(my_df), _frame_digest(comp_df), str(chunk_size),
+                 json.dumps(params, sort_keys=True, default=str)]
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+    def completed_chunks(self):
+        """{رقم الدفعة: قائمة النتائج}"""
+        return {chunk_no: json.loads(results_json) for chunk_no, results_json in self.conn.execute(
+            "SELECT chunk_no, results_json FROM checkpoint_chunks WHERE run_key = ?", (self.run_key,))}
+
+    def save_chunk(self, chunk_no, results):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoint_chunks (run_key, chunk_no, results_json, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (self.run_key, chunk_no, json.dumps(results, ensure_ascii=False, default=_json_default), time.time()))
+
+    def evict(self, max_age=MAX_AGE, max_runs=MAX_RUNS):
+        """حذف نقاط تشغيلات متروكة (تغيّر الملف أو الإعدادات قبل الاكتمال فلن يُستأنف مفتاحها):
+        الأقدم من max_age حسب آخر دفعة، وما زاد عن أحدث max_runs تشغيلاً؛ التشغيل الحالي لا يُحذف
+        """
+        runs = self.conn.execute(
+            "SELECT run_key, max(created_at) AS last FROM checkpoint_chunks WHERE run_key != ? "
+            "GROUP BY run_key ORDER BY last DESC", (self.run_key,)).fetchall()
+        cutoff = time.time() - max_age
+        stale = [(key,) for n, (key, last) in enumerate(runs) if last < cutoff or n >= max_runs - 1]
+        if stale:
+            with self.conn:
+                self.conn.executemany("DELETE FROM checkpoint_chunks WHERE run_key = ?", stale)
+
+    def clear(self):
+        """حذف نقاط الاستئناف بعد اكتمال التشغيل"""
+        with self.conn:
+            self.conn.execute("DELETE FROM checkpoint_chunks WHERE run_key = ?", (self.run_key,))
+
+    def close(self):
+        self.conn.close()
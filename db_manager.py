@@ -1,15 +1,136 @@
 import streamlit as st
 from supabase import create_client
+import atexit
+import threading
+import time
 import uuid
+import weakref
 from datetime import datetime
 
+# الكاتبات المفتوحة تُغلق مرة واحدة عند خروج العملية (تسجيل atexit واحد لا تسجيل لكل كاتب)
+_open_writers = weakref.WeakSet()
+
+def _close_open_writers():
+    for writer in list(_open_writers):
+        writer.close()
+
+atexit.register(_close_open_writers)
+
+class BufferedWriter:
+    """تجميع صفوف جدول واحد وإرسالها كإدخال جماعي (bulk insert) من خيط خلفي
+
+    الإرسال عند اكتمال batch_size صف أو كل flush_interval ثانية؛ الدفعة الفاشلة تُعاد لاحقاً
+    (حتى max_retries) دون إيقاف المطابقة.
+    """
+
+    def __init__(self, supabase, table, batch_size=500, flush_interval=2.0, max_retries=3):
+        self.supabase = supabase
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.rows = []
+        self.retries = []  # (موعد المحاولة, رقم المحاولة, الصفوف)
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)  # يُنبَّه عند انتهاء كل إرسال جارٍ
+        self.inflight = 0                            # دفعات أُخذت من المخزن ولم ينته إرسالها
+        self.wake = threading.Event()
+        self.stopped = False
+        self.stats = {"written": 0, "batches": 0, "retries": 0, "failed": 0}
+        self.reported_failed = 0                     # الفاشل حتى آخر flush()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        _open_writers.add(self)
+
+    def add(self, row):
+        with self.lock:
+            self.rows.append(row)
+            full = len(self.rows) >= self.batch_size
+        if full:
+            self.wake.set()
+
+    def _insert(self, batch, attempt):
+        try:
+            self.supabase.table(self.table).insert(batch).execute()
+            with self.lock:
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+        except Exception:
+            with self.lock:
+                if attempt < self.max_retries:
+                    self.stats["retries"] += 1
+                    self.retries.append((time.time() + 2 ** attempt, attempt + 1, batch))
+                else:
+                    self.stats["failed"] += len(batch)
+
+    def _flush_once(self, force=False):
+        now = time.time()
+        force = force or self.stopped
+        with self.lock:
+            rows, self.rows = self.rows, []
+            # عند الإغلاق أو flush تُعاد المحاولات فوراً بدل انتظار موعدها
+            due = [r for r in self.retries if force or r[0] <= now]
+            self.retries = [r for r in self.retries if not (force or r[0] <= now)]
+            if not rows and not due:
+                return
+            self.inflight += 1
+        try:
+            for start in range(0, len(rows), self.batch_size):
+                self._insert(rows[start:start + self.batch_size], 0)
+            for _, attempt, batch in due:
+                self._insert(batch, attempt)
+        finally:
+            with self.lock:
+                self.inflight -= 1
+                self.idle.notify_all()
+
+    def _pending(self):
+        with self.lock:
+            return bool(self.rows or self.retries)
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self._flush_once()
+            if self.stopped and not self._pending():
+                return
+
+    def flush(self):
+        """إرسال كل المعلّق الآن (قبل حفظ نقطة استئناف مثلاً) وانتظار الإرسال الجاري في الخيط الخلفي.
+
+        يعيد عدد الصفوف التي فشلت نهائياً منذ آخر flush (0 = كل ما أُضيف قبل الاستدعاء مكتوب).
+        """
+        while True:
+            self._flush_once(force=True)
+            with self.lock:
+                while self.inflight:
+                    self.idle.wait()
+                # دفعة جارية فشلت أُعيدت إلى retries بعد انتظارها: جولة أخرى حتى تنجح أو تُستنفد محاولاتها
+                if not (self.rows or self.retries):
+                    failed = self.stats["failed"] - self.reported_failed
+                    self.reported_failed = self.stats["failed"]
+                    return failed
+
+    def close(self, timeout=60):
+        """إرسال ما تبقى (مرة أخيرة في نهاية التشغيل) وانتظار انتهاء الخيط"""
+        if self.stopped:
+            return
+        _open_writers.discard(self)
+        self.stopped = True
+        self.wake.set()
+        self.thread.join(timeout)
+
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, buffered=True):
         try:
             self.supabase = create_client(st.secrets["supabase"]["url"], st.secrets["supabase"]["key"])
             self.active = True
         except:
             self.active = False
+        # نتائج المطابقة تُرسل على دفعات من خيط خلفي بدل طلب HTTP لكل منتج (يُنشأ عند أول حفظ)
+        self.buffered = buffered
+        self.writer = None
 
     def get_session_id(self):
         if "session_id" not in st.session_state:
@@ -17,7 +138,7 @@ class DatabaseManager:
         return st.session_state.session_id
 
     def save_match(self, my_prod, comp_prod, res):
-        """حفظ نتائج المطابقة فوراً"""
+        """حفظ نتائج المطابقة (في المخزن المؤقت أو فوراً إذا كان التخزين المؤقت معطلاً)"""
         if not self.active: return
         data = {
             "session_id": self.get_session_id(),
@@ -26,7 +147,25 @@ class DatabaseManager:
             "decision": res.get("القرار"),
             "created_at": datetime.now().isoformat()
         }
-        self.supabase.table("analysis_results").insert(data).execute()
+        if self.buffered:
+            if self.writer is None:
+                self.writer = BufferedWriter(self.supabase, "analysis_results")
+            self.writer.add(data)
+        else:
+            self.supabase.table("analysis_results").insert(data).execute()
+
+    def flush(self):
+        """كتابة المخزن المؤقت الآن (متزامن)؛ تُستدعى قبل حفظ نقطة استئناف. يعيد الصفوف الفاشلة منذ آخر flush"""
+        if self.writer:
+            return self.writer.flush()
+        return 0
+
+    def close(self):
+        """إرسال ما تبقى في المخزن المؤقت؛ تُستدعى في نهاية كل تشغيل"""
+        if self.writer:
+            self.writer.close()
+            return self.writer.stats
+        return None
 
     # وظائف ERP (المشتريات والموردين)
     def add_purchase(self, data):
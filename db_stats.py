@@ -0,0 +1,114 @@
+"""
+db_stats.py
+إحصائيات قاعدة البيانات محسوبة في Postgres (عرض db_stats) بدل جمع آخر 100 صف في Python
+مع ذاكرة مؤقتة قصيرة داخل العملية مشتركة بين كل الجلسات
+
+يعتمد فقط على client.select(table, params) و client.request(..., prefer=...) من supabase_client،
+فيمكن تشغيله على PostgREST محلي أو بديل مبني على SQLite بنفس الواجهة.
+"""
+
+import threading
+import time
+
+VIEW = "db_stats"
+DEFAULT_TTL = 60  # ثوانٍ
+
+# يُنفَّذ مرة واحدة في محرر SQL الخاص بـ Supabase
+SCHEMA = """
+CREATE OR REPLACE VIEW db_stats AS
+SELECT
+    (SELECT count(*) FROM analysis_results)                          AS total_records,
+    (SELECT coalesce(sum(price_increase), 0) FROM analysis_results)  AS raise_count,
+    (SELECT coalesce(sum(price_decrease), 0) FROM analysis_results)  AS lower_count,
+    (SELECT coalesce(sum(approved), 0) FROM analysis_results)        AS approved_count,
+    (SELECT count(*) FROM send_log)                                  AS total_sends,
+    (SELECT count(*) FROM send_log WHERE status = 'نجح')             AS successful_sends;
+"""
+
+EMPTY_STATS = {"total_records": 0, "raise_count": 0, "lower_count": 0, "approved_count": 0,
+               "total_sends": 0, "successful_sends": 0}
+
+
+def _from_view(client):
+    """صف واحد من العرض؛ None إذا لم يُنشأ العرض بعد"""
+    r = client.select(VIEW, params={"select": "*", "limit": "1"})
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    rows = r.json()
+    if not rows:
+        return None
+    return {k: int(rows[0].get(k) or 0) for k in EMPTY_STATS}
+
+
+def _exact_count(client, table, filters=None):
+    """عدد الصفوف من ترويسة Content-Range (count=exact) دون تنزيل الصفوف"""
+    r = client.request("GET", table, params={"select": "id", "limit": "1", **(filters or {})},
+                       prefer="count=exact")
+    r.raise_for_status()
+    total = r.headers.get("Content-Range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else len(r.json())
+
+
+def _fallback(client):
+    """بدون العرض: أعداد دقيقة بـ count=exact، والمجاميع بقراءة الأعمدة الرقمية على صفحات"""
+    stats = dict(EMPTY_STATS)
+    stats["total_records"] = _exact_count(client, "analysis_results")
+    for rows in client.iter_pages("analysis_results", select="id,price_increase,price_decrease,approved"):
+        for row in rows:
+            stats["raise_count"] += row.get("price_increase") or 0
+            stats["lower_count"] += row.get("price_decrease") or 0
+            stats["approved_count"] += row.get("approved") or 0
+    stats["total_sends"] = _exact_count(client, "send_log")
+    stats["successful_sends"] = _exact_count(client, "send_log", {"status": "eq.نجح"})
+    return stats
+
+
+def fetch_db_stats(client):
+    """الإحصائيات من قاعدة البيانات مباشرة (بدون ذاكرة مؤقتة)"""
+    return _from_view(client) or _fallback(client)
+
+
+_cache = {}
+_inflight = {}      # id(client) -> Event للجلب الجاري (single-flight)
+_generation = 0     # يزيد مع كل invalidate: جلب بدأ قبله لا يُخزَّن
+_cache_lock = threading.Lock()
+
+
+def get_db_stats(client, ttl=DEFAULT_TTL):
+    """الإحصائيات مع ذاكرة مؤقتة لـ ttl ثانية؛ طلب واحد فقط عند انتهاء الصلاحية مهما تعددت الجلسات
+
+    الجلب يتم خارج القفل: الجلسات الأخرى لنفس العميل تنتظر نتيجته، ولا يتأثر بقية العملاء
+    """
+    key = id(client)
+    while True:
+        with _cache_lock:
+            cached = _cache.get(key)
+            if cached and time.monotonic() - cached[0] < ttl:
+                return dict(cached[1])
+            event = _inflight.get(key)
+            leader = event is None
+            if leader:
+                event = _inflight[key] = threading.Event()
+                generation = _generation
+        if not leader:
+            event.wait()
+            continue  # نتيجة الجلب الجاري (أو محاولة جديدة إن فشل)
+        try:
+            stats = fetch_db_stats(client)
+            with _cache_lock:
+                if generation == _generation:
+                    _cache[key] = (time.monotonic(), stats)
+            return dict(stats)
+        finally:
+            with _cache_lock:
+                _inflight.pop(key, None)
+            event.set()
+
+
+def invalidate():
+    """تفريغ الذاكرة المؤقتة بعد كتابة تغيّر الأعداد (تحليل جديد، سجل إرسال، حذف)"""
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        _cache.clear()
@@ -3,11 +3,42 @@ from rapidfuzz import fuzz, process
 import streamlit as st
 import requests
 import json
+import os
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
 from db_manager import DatabaseManager # استيراد مدير القاعدة
+from matcher import match_top_k
+from normalizer import normalize_name, is_compatible
+from incremental import IncrementalState, row_hash
+from ingest import iter_record_chunks
+from ai_cache import get_pair_cache, pair_key
+from ai_pipeline import VerificationPipeline, provider_slot
+import rate_limit
+from ai_router import get_router
+from profiling import StageProfiler, report_profile
+
+def run_full_analysis(my_df, comp_df, threshold=60, progress_callback=None, match_mode="matrix", top_k=5,
+                      incremental_scope=None):
+    """المحرك المطور: يجمع بين السرعة والذكاء والحفظ اللحظي
+
+    match_mode="matrix": مطابقة مصفوفية دفعة واحدة عبر cdist (الافتراضي)
+    match_mode="loop": استدعاء extractOne لكل منتج (الطريقة القديمة)
+    incremental_scope: اسم نطاق (مثل اسم ملف المنافس) لتفعيل إعادة التحليل التزايدي
+    progress_callback(percent, message) في المسارين (ملف منافس واحد أو عدة ملفات)
+    زمن كل مرحلة في df.attrs["profile"] ويُمرَّر أيضاً عبر progress_callback(..., profile=...)
+    """
+    profiler = StageProfiler()
+    # ملفات مرفوعة من صفحة الرفع: {"name", "data"} للمتجر وقائمة ملفات للمنافسين
+    if isinstance(my_df, dict):
+        with profiler.span("parse"):
+            my_df = read_uploaded_file(my_df)
+    if isinstance(comp_df, (list, tuple)):
+        return run_multi_competitor_analysis(my_df, comp_df, threshold=threshold,
+                                             progress_callback=progress_callback, top_k=top_k,
+                                             incremental_scope=incremental_scope, profiler=profiler)
 
-def run_full_analysis(my_df, comp_df, threshold=60, progress_callback=None):
-    """المحرك المطور: يجمع بين السرعة والذكاء والحفظ اللحظي"""
     db = DatabaseManager()
     session_id = db.get_session_id()
     
@@ -19,59 +50,658 @@ def run_full_analysis(my_df, comp_df, threshold=60, progress_callback=None):
     my_name_col = next((c for c in my_df.columns if 'name' in str(c).lower() or 'اسم' in str(c)), my_df.columns[0])
     comp_names = comp_df.iloc[:, 0].tolist() # نفترض العمود الأول هو الاسم لدى المنافس
 
-    # 2. حلقة المعالجة مع الحفظ اللحظي
-    for idx, row in my_df.iterrows():
+    # توحيد الأسماء واستخراج الخصائص (مرة واحدة لكل اسم فريد)
+    with profiler.span("normalize", items=len(comp_names) + total):
+        comp_infos = [normalize_name(str(n)) for n in comp_names]
+        comp_keys = [info.canonical for info in comp_infos]
+        my_infos = [normalize_name(str(v)) for v in my_df[my_name_col].tolist()]
+
+    # التحليل التزايدي: إعادة مطابقة الصفوف المتغيرة فقط
+    rescore, reused = list(range(total)), {}
+    if incremental_scope:
+        with profiler.span("incremental", items=total):
+            store_hashes = [row_hash(*r) for r in my_df.itertuples(index=False)]
+            comp_hashes = [row_hash(*r) for r in comp_df.itertuples(index=False)]
+            inc_state = IncrementalState(incremental_scope, threshold=threshold, top_k=top_k)
+            rescore, reused = inc_state.plan(store_hashes, my_infos, comp_hashes, comp_infos, threshold, top_k)
+        inc_entries = {}
+
+    # مطابقة مصفوفية: جميع المنتجات مقابل جميع المنافسين في بلاطات متعددة الأنوية
+    if match_mode == "matrix":
+        with profiler.span("fuzzy", items=len(rescore)):
+            top_idx, top_scores = match_top_k([my_infos[p].canonical for p in rescore], comp_keys, threshold=threshold, top_k=top_k)
+        top_row = {p: i for i, p in enumerate(rescore)}
+
+    # 2. المطابقة السريعة (RapidFuzz) وتجميع الأزواج المشكوك فيها
+    # التحقق بالذكاء الاصطناعي يعمل في الخلفية بينما تستمر المطابقة
+    matches = {}     # pos -> (match, my_price, comp_price)
+    pipeline = VerificationPipeline(verify_pairs_batch, batch_size=AI_BATCH_SIZE, profiler=profiler)
+    loop_start, fuzzy_seconds = time.perf_counter(), 0.0
+    for pos, (idx, row) in enumerate(my_df.iterrows()):
+        if pos in reused:
+            continue
+
         my_name = str(row.get(my_name_col, '')).lower()
+        my_info = my_infos[pos]
         
-        # أ) مطابقة سريعة (RapidFuzz)
-        match = process.extractOne(my_name, comp_names, scorer=fuzz.token_sort_ratio)
+        # أ) مطابقة سريعة على الأسماء الموحدة
+        if match_mode == "matrix":
+            r = top_row[pos]
+            candidates = [(int(j), float(sc)) for j, sc in zip(top_idx[r], top_scores[r]) if j >= 0]
+        else:
+            t = time.perf_counter()
+            candidates = [(j, sc) for _, sc, j in process.extract(my_info.canonical, comp_keys, scorer=fuzz.token_sort_ratio,
+                                                                  score_cutoff=threshold, limit=top_k)]
+            fuzzy_seconds += time.perf_counter() - t
+        # أول مرشح متوافق في الحجم والتركيز والماركة (تستر/طقم)
+        match = next(((comp_names[j], sc, j) for j, sc in candidates if is_compatible(my_info, comp_infos[j])), None)
         
-        best_match_data = None
+        comp_price = my_price = 0
         if match and match[1] >= threshold:
             best_match_data = comp_df.iloc[match[2]].to_dict()
             comp_price = best_match_data.get('price', best_match_data.get('السعر', 0))
             my_price = row.get('price', row.get('السعر', 0))
             
-            # ب) التحقق بالذكاء الاصطناعي (عند الطلب أو للمطابقات المشكوك فيها)
-            # إذا كان التطابق بين 60% و 85%، نستعين بالذكاء الاصطناعي فوراً
-            ai_verdict = {"is_match": True, "reason": "تطابق نصي قوي"}
+            # إذا كان التطابق بين 60% و 85%، نستعين بالذكاء الاصطناعي
             if 60 <= match[1] <= 85:
-                ai_res = train_and_verify_ai(my_name, match[0], my_price, comp_price)
-                if ai_res:
-                    ai_verdict = json.loads(ai_res)
+                pipeline.submit({"id": pos, "my_name": my_name, "comp_name": match[0],
+                                 "my_price": my_price, "comp_price": comp_price, "score": match[1]})
+        matches[pos] = (match, my_price, comp_price)
+    if match_mode != "matrix":
+        profiler.add("fuzzy", fuzzy_seconds, calls=len(matches), items=len(matches))
+    # انتظار submit عند امتلاء طابور التحقق مسجل وحده في ai_backpressure
+    profiler.add("candidates", time.perf_counter() - loop_start - fuzzy_seconds - pipeline.submit_wait,
+                 items=len(matches))
 
-            if ai_verdict.get("is_match"):
+    # ب) انتظار أحكام الذكاء الاصطناعي المتبقية
+    with profiler.span("ai_wait"):
+        verdicts = pipeline.close()
+    unverified = 0
+
+    # 3. بناء النتائج مع الحفظ اللحظي
+    for pos, (idx, row) in enumerate(my_df.iterrows()):
+        if pos in reused:
+            # صف لم يتغير: نتيجة التشغيل السابق كما هي
+            if reused[pos][2] is not None:
+                results.append(reused[pos][2])
+            inc_entries[store_hashes[pos]] = reused[pos]
+            _report_rows(progress_callback, pos + 1, total)
+            continue
+
+        match, my_price, comp_price = matches[pos]
+        res = None
+        if match and match[1] >= threshold:
+            # المشكوك فيه بلا حكم (مهلة/عطل/قاطع مفتوح) لا يُعتبر تطابقاً: يذهب للمراجعة
+            ai_verdict = verdicts.get(pos) or (_unverified() if 60 <= match[1] <= 85 else
+                                               {"is_match": True, "reason": "تطابق نصي قوي"})
+            if ai_verdict.get("is_match") is not False:
+                verified = ai_verdict.get("is_match") is True
+                unverified += not verified
                 res = {
                     "المنتج": row.get(my_name_col),
                     "سعرك": my_price,
                     "اسم المنافس": match[0],
                     "سعر المنافس": comp_price,
                     "الثقة": match[1],
-                    "القرار": "رفع 🔴" if float(comp_price) > float(my_price) else "خفض 🟡",
-                    "تفسير_AI": ai_verdict.get("reason", "")
+                    "القرار": _decision(my_price, comp_price, verified),
+                    "تفسير_AI": ai_verdict.get("reason", ""),
+                    "متحقق": verified,
                 }
                 results.append(res)
                 # حفظ لحظي في Supabase لمنع ضياع التقدم
-                db.save_match(res['المنتج'], res['اسم المنافس'], res)
+                with profiler.span("db_write", items=1):
+                    db.save_match(res['المنتج'], res['اسم المنافس'], res)
 
-        # تحديث الواجهة (حل مشكلة TypeError)
-        if progress_callback:
-            progress_callback(idx + 1, total)
+        # غير المتحقق منه لا يُحفظ في الحالة التزايدية: يُعاد التحقق منه في التشغيل التالي
+        if incremental_scope and not (res and not res["متحقق"]):
+            inc_entries[store_hashes[pos]] = (comp_hashes[match[2]] if match else None,
+                                              match[1] if match else 0, res)
 
-    return pd.DataFrame(results)
+        # تحديث الواجهة
+        _report_rows(progress_callback, pos + 1, total)
 
-def train_and_verify_ai(my_name, comp_name, my_price, comp_price):
-    """خبير العطور المدرب عبر OpenRouter"""
+    # آخر دفعة من نتائج Supabase المؤقتة
+    with profiler.span("db_write"):
+        db.close()
+    get_pair_cache().evict()
+    df = pd.DataFrame(results)
+    if incremental_scope:
+        with profiler.span("incremental"):
+            inc_state.save(comp_hashes, inc_entries)
+            inc_state.close()
+        df.attrs["incremental"] = inc_state.stats
+    df.attrs["unverified"] = unverified
+    _report_unverified(progress_callback, unverified, 80)
+    df.attrs["profile"] = profiler.summary()
+    report_profile(progress_callback, df.attrs["profile"])
+    return df
+
+def _decision(my_price, comp_price, verified=True):
+    if not verified:
+        return "مراجعة ⚪"
+    return "رفع 🔴" if float(comp_price) > float(my_price) else "خفض 🟡"
+
+def _report_unverified(progress_callback, count, percent):
+    """تنبيه بعدد الأزواج المشكوك فيها التي لم يصل حكمها (ذهبت لقسم المراجعة)"""
+    if progress_callback and count:
+        progress_callback(percent, f"⚠️ {count} تطابق لم يتم التحقق منه بالذكاء الاصطناعي — في قسم المراجعة")
+
+def _report_rows(progress_callback, done, total):
+    """تقدم بناء النتائج بنفس عقد وضع المنافسين المتعددين: progress_callback(نسبة 10..80، رسالة)"""
+    if progress_callback:
+        progress_callback(int(10 + 70 * done / max(total, 1)), f"🔍 تمت مطابقة {done}/{total} منتج")
+
+# ══════════════════════════════════════════════════════════════
+# وضع المنافسين المتعددين: كل ملف منافس في عملية مستقلة
+# ══════════════════════════════════════════════════════════════
+
+def read_uploaded_file(file_info):
+    """تحويل ملف مرفوع {"name", "data"} إلى DataFrame"""
+    if str(file_info["name"]).lower().endswith(".csv"):
+        return pd.read_csv(BytesIO(file_info["data"]))
+    return pd.read_excel(BytesIO(file_info["data"]))
+
+def _to_float(val):
+    try:
+        return float(str(val).replace(',', ''))
+    except (TypeError, ValueError):
+        return 0.0
+
+def _scan_chunk(positions, my_infos, chunk, threshold, top_k, best):
+    """تحديث أفضل عرض لكل منتج متجر من دفعة واحدة من سجلات المنافس
+
+    chunk: قائمة (Record, ProductInfo, بصمة)، best[pos] = (بصمة المنافس, الثقة, العرض)
+    """
+    if not positions or not chunk:
+        return
+    # workers=1: التوازي هنا على مستوى الملفات، لا داخل cdist
+    top_idx, top_scores = match_top_k([my_infos[p].canonical for p in positions], [c[1].canonical for c in chunk],
+                                      threshold=threshold, top_k=top_k, workers=1)
+    for r, pos in enumerate(positions):
+        for j, sc in zip(top_idx[r], top_scores[r]):
+            if j >= 0 and is_compatible(my_infos[pos], chunk[j][1]):
+                if sc > best[pos][1]:
+                    rec = chunk[j][0]
+                    best[pos] = (chunk[j][2], float(sc), (rec.name, rec.price, float(sc)))
+                break
+
+def _unmatched_records(chunk, my_infos, store_keys, threshold, top_k):
+    """سجلات المنافس التي لا يقابلها أي منتج متوافق في متجرنا (قسم «منتجات مفقودة»)
+
+    تعيد [(الاسم الموحد، الاسم، السعر، التركيز، الحجم)]
+    """
+    if not chunk or not store_keys:
+        return [(c[1].canonical, c[0].name, c[0].price, c[1].concentration, c[1].size_ml) for c in chunk]
+    top_idx, _ = match_top_k([c[1].canonical for c in chunk], store_keys, threshold=threshold, top_k=top_k, workers=1)
+    return [(info.canonical, rec.name, rec.price, info.concentration, info.size_ml)
+            for r, (rec, info, _) in enumerate(chunk)
+            if not any(j >= 0 and is_compatible(my_infos[j], info) for j in top_idx[r])]
+
+def _timed_chunks(file_info, profiler):
+    """iter_record_chunks مع قياس زمن القراءة"""
+    chunks = iter_record_chunks(file_info)
+    while True:
+        start = time.perf_counter()
+        records = next(chunks, None)
+        if records is None:
+            return
+        profiler.add("parse", time.perf_counter() - start, items=len(records))
+        yield records
+
+def _normalize_chunk(records, profiler):
+    with profiler.span("normalize", items=len(records)):
+        return [(rec, normalize_name(rec.name), row_hash(rec.name, rec.price, rec.sku)) for rec in records]
+
+def _match_competitor_file(file_info, my_infos, threshold, top_k, store_hashes=None, incremental_scope=None):
+    """عامل مستقل: قراءة ملف منافس واحد كتدفق ومطابقته مع جميع منتجات المتجر
+
+    لا يُحمَّل الملف كاملاً في الذاكرة: كل دفعة تُطابق ثم تُهمل، ويبقى فقط أفضل عرض لكل منتج.
+    تعيد (اسم الملف، أفضل عرض لكل منتج، أزمنة المراحل، منتجات المنافس غير الموجودة لدينا)
+    """
+    profiler = StageProfiler()
+    n = len(my_infos)
+    best = [(None, 0.0, None)] * n
+    store_keys = [info.canonical for info in my_infos]
+    missing = []
+    full, reusable, prev_comp, prev_store = list(range(n)), [], set(), {}
+
+    # التحليل التزايدي: الصفوف غير المتغيرة تُقارن فقط مع صفوف المنافس الجديدة/المتغيرة
+    if incremental_scope:
+        inc_state = IncrementalState(f"{incremental_scope}/{file_info['name']}", threshold=threshold, top_k=top_k)
+        prev_comp, prev_store = inc_state.load()
+        full = [p for p in range(n) if store_hashes[p] not in prev_store]
+        reusable = [p for p in range(n) if store_hashes[p] in prev_store]
+        seen_hashes = set()
+
+    for records in _timed_chunks(file_info, profiler):
+        chunk = _normalize_chunk(records, profiler)
+        with profiler.span("missing", items=len(chunk)):
+            missing.extend(_unmatched_records(chunk, my_infos, store_keys, threshold, top_k))
+        with profiler.span("fuzzy", items=len(chunk)):
+            _scan_chunk(full, my_infos, chunk, threshold, top_k, best)
+            if incremental_scope:
+                seen_hashes.update(c[2] for c in chunk)
+                _scan_chunk(reusable, my_infos, [c for c in chunk if c[2] not in prev_comp], threshold, top_k, best)
+
+    if incremental_scope:
+        # أفضل صف قديم لم يتغير = المطابقة السابقة؛ إن اختفت ولم يعوضها صف جديد مساوٍ نعيد المسح
+        rescan = []
+        for pos in reusable:
+            prev_hash, prev_score, prev_offer = prev_store[store_hashes[pos]]
+            vanished = prev_hash is not None and prev_hash not in seen_hashes
+            if best[pos][1] > prev_score or (vanished and best[pos][1] >= prev_score):
+                continue
+            if vanished:
+                rescan.append(pos)
+                best[pos] = (None, 0.0, None)
+            else:
+                best[pos] = (prev_hash, prev_score, tuple(prev_offer) if prev_offer else None)
+        if rescan:
+            for records in _timed_chunks(file_info, profiler):
+                chunk = _normalize_chunk(records, profiler)
+                with profiler.span("fuzzy", items=len(chunk)):
+                    _scan_chunk(rescan, my_infos, chunk, threshold, top_k, best)
+
+        with profiler.span("incremental"):
+            inc_state.save(seen_hashes, {store_hashes[p]: best[p] for p in range(n)})
+            inc_state.close()
+
+    return file_info["name"], [entry[2] for entry in best], profiler.stages, missing
+
+def run_multi_competitor_analysis(my_df, comp_files, threshold=60, progress_callback=None, top_k=5, max_workers=None,
+                                  incremental_scope=None, profiler=None):
+    """مطابقة المتجر مع عدة ملفات منافسين بالتوازي ثم دمج أقل سعر لكل منتج"""
+    profiler = profiler or StageProfiler()
+    db = DatabaseManager()
+    my_name_col = next((c for c in my_df.columns if 'name' in str(c).lower() or 'اسم' in str(c)), my_df.columns[0])
+    with profiler.span("normalize", items=len(my_df)):
+        my_infos = [normalize_name(str(v)) for v in my_df[my_name_col].tolist()]
+    store_hashes = [row_hash(*r) for r in my_df.itertuples(index=False)] if incremental_scope else None
+
+    # offers_by_pos[pos] = [(المنافس, اسم المنتج لديه, السعر, الثقة), ...]
+    offers_by_pos = [[] for _ in range(len(my_df))]
+    missing = {}  # الاسم الموحد -> أرخص عرض لمنتج غير موجود لدينا (عبر كل المنافسين)
+    done = 0
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        futures = [pool.submit(_match_competitor_file, f, my_infos, threshold, top_k, store_hashes, incremental_scope)
+                   for f in comp_files]
+        for future in as_completed(futures):
+            done += 1
+            try:
+                comp_label, offers, worker_stages, comp_missing = future.result()
+            except Exception as e:
+                if progress_callback:
+                    progress_callback(int(10 + 70 * done / len(futures)), f"⚠️ فشل ملف منافس: {e}")
+                continue
+            profiler.merge(worker_stages)
+            for pos, offer in enumerate(offers):
+                if offer:
+                    offers_by_pos[pos].append((comp_label,) + offer)
+            for key, name, price, concentration, size_ml in comp_missing:
+                if key not in missing or 0 < price < missing[key]["السعر"]:
+                    missing[key] = {"المنتج": name, "السعر": price, "المنافس": comp_label,
+                                    "النوع": (concentration or "").upper(), "الحجم": f"{size_ml:g}ml" if size_ml else ""}
+            if progress_callback:
+                progress_callback(int(10 + 70 * done / len(futures)), f"🏪 تمت مطابقة {done}/{len(futures)} منافس")
+
+    merge_start = time.perf_counter()
+    rows = [row for _, row in my_df.iterrows()]
+    my_prices = [_to_float(row.get('price', row.get('السعر', 0))) for row in rows]
+    # الأرخص أولاً؛ العروض بسعر صفر غير صالحة للمقارنة
+    sorted_offers = {pos: sorted((o for o in offers if o[2] > 0), key=lambda o: o[2])
+                     for pos, offers in enumerate(offers_by_pos)}
+    sorted_offers = {pos: offers for pos, offers in sorted_offers.items() if offers}
+
+    # التحقق بالذكاء الاصطناعي على جولات: كل جولة ترسل العرض الحالي المشكوك فيه لجميع المنتجات دفعة واحدة،
+    # والمنتج المرفوض عرضه ينتقل لعرضه التالي في الجولة التالية
+    cursor = {pos: 0 for pos in sorted_offers}
+    chosen = {}
+    active = set(sorted_offers)
+    while active:
+        borderline = []
+        for pos in sorted(active):
+            offer = sorted_offers[pos][cursor[pos]]
+            if 60 <= offer[3] <= 85:
+                borderline.append({"id": pos, "my_name": str(rows[pos].get(my_name_col, '')), "comp_name": offer[1],
+                                   "my_price": my_prices[pos], "comp_price": offer[2], "score": offer[3]})
+            else:
+                chosen[pos] = (offer, {"is_match": True, "reason": "تطابق نصي قوي"})
+                active.discard(pos)
+        merge_start -= time.perf_counter()
+        verdicts = verify_pairs_concurrently(borderline, profiler=profiler)
+        merge_start += time.perf_counter()  # وقت الذكاء الاصطناعي لا يُحسب على الدمج
+        for pair in borderline:
+            pos = pair["id"]
+            # بلا حكم: يتوقف عند هذا العرض ويُعلَّم غير متحقق بدل الانتقال للعرض التالي
+            ai_verdict = verdicts.get(pos) or _unverified()
+            if ai_verdict.get("is_match") is not False:
+                chosen[pos] = (sorted_offers[pos][cursor[pos]], ai_verdict)
+                active.discard(pos)
+            else:
+                cursor[pos] += 1
+                if cursor[pos] >= len(sorted_offers[pos]):
+                    active.discard(pos)
+
+    profiler.add("merge", time.perf_counter() - merge_start, items=len(rows))
+
+    results = []
+    unverified = 0
+    for pos in sorted(chosen):
+        offer, ai_verdict = chosen[pos]
+        verified = ai_verdict.get("is_match") is True
+        unverified += not verified
+        # الإحصائيات من العروض المقبولة فقط: المختار + العروض الأغلى بتطابق نصي قوي؛
+        # المرفوضة من الذكاء الاصطناعي (قبل المختار) والمشكوك فيها غير المتحقق منها مستبعدة
+        offers = [o for i, o in enumerate(sorted_offers[pos]) if i == cursor[pos]
+                  or (i > cursor[pos] and not 60 <= o[3] <= 85)]
+        prices = [o[2] for o in offers]
+        res = {
+            "المنتج": rows[pos].get(my_name_col),
+            "سعرك": my_prices[pos],
+            "اسم المنافس": offer[1],
+            "المنافس": offer[0],
+            "أقل سعر منافس": offer[2],
+            "أعلى سعر منافس": max(prices),
+            "فرق أسعار المنافسين": round(max(prices) - min(prices), 2),
+            "عدد المنافسين": len(offers),
+            "الثقة": offer[3],
+            "القرار": _decision(my_prices[pos], offer[2], verified),
+            "تفسير_AI": ai_verdict.get("reason", ""),
+            "متحقق": verified,
+        }
+        results.append(res)
+        with profiler.span("db_write", items=1):
+            db.save_match(res['المنتج'], res['اسم المنافس'], res)
+
+    with profiler.span("db_write"):
+        db.close()
+    get_pair_cache().evict()
+    if progress_callback:
+        progress_callback(85, f"✅ تم دمج نتائج {len(comp_files)} منافس")
+    df = pd.DataFrame(results)
+    df.attrs["missing"] = list(missing.values())
+    df.attrs["competitors"] = len(comp_files)
+    df.attrs["unverified"] = unverified
+    _report_unverified(progress_callback, unverified, 86)
+    df.attrs["profile"] = profiler.summary()
+    report_profile(progress_callback, df.attrs["profile"], percent=88)
+    return df
+
+# ══════════════════════════════════════════════════════════════
+# أقسام صفحة النتائج
+# ══════════════════════════════════════════════════════════════
+
+CRITICAL_GAP_PCT = 30   # فرق سعر (%) يجعل المنتج «حرج» في قسم المراجعة
+MEDIUM_GAP_PCT = 15     # و«متوسط» من هذه النسبة
+
+def build_result_sections(df):
+    """نتيجة run_full_analysis -> أقسام التطبيق {raise, lower, approved, review, missing, all, stats}
+
+    نفس الشكل الذي تعرضه صفحات app.py ويحفظه save_results_to_db/save_run_rows.
+    raise: المنافس أغلى منا، lower: أرخص، approved: نفس السعر (المتحقق منها فقط)؛
+    review: فرق سعر كبير (حرج/متوسط) أو تطابق لم يتم التحقق منه
+    """
+    from results_store import combine_all
+    attrs, df.attrs = dict(df.attrs), {}  # attrs تُنسخ مع كل عملية على df
+    rows = []
+    for rec in df.to_dict(orient="records"):
+        my_price = _to_float(rec.get("سعرك"))
+        comp_price = _to_float(rec.get("أقل سعر منافس", rec.get("سعر المنافس")))
+        diff = round(comp_price - my_price, 2)
+        pct = round(diff / my_price * 100, 1) if my_price else 0.0
+        risk = "حرج" if abs(pct) >= CRITICAL_GAP_PCT else "متوسط" if abs(pct) >= MEDIUM_GAP_PCT else "عادي"
+        if rec.get("متحقق") is False:
+            risk = "غير متحقق"
+        rows.append({**rec, "السعر": my_price, "أقل سعر منافس": comp_price, "الفرق": diff, "النسبة %": pct,
+                     "الثقة %": round(_to_float(rec.get("الثقة")), 1), "الخطورة": risk})
+    frame = pd.DataFrame(rows)
+
+    def pick(mask):
+        return frame[mask].reset_index(drop=True)
+    if frame.empty:
+        sections = {key: pd.DataFrame() for key in ("raise", "lower", "approved", "review")}
+    else:
+        verified = frame["الخطورة"] != "غير متحقق"
+        sections = {"raise": pick(verified & (frame["الفرق"] > 0)), "lower": pick(verified & (frame["الفرق"] < 0)),
+                    "approved": pick(verified & (frame["الفرق"] == 0)), "review": pick(frame["الخطورة"] != "عادي")}
+    sections["missing"] = pd.DataFrame(attrs.get("missing", []))
+    sections["all"] = combine_all(sections)
+    sections["stats"] = {
+        "total": len(frame),
+        "raise_count": len(sections["raise"]),
+        "lower_count": len(sections["lower"]),
+        "approved_count": len(sections["approved"]),
+        "missing_count": len(sections["missing"]),
+        "review_count": len(sections["review"]),
+        "unverified_count": attrs.get("unverified", 0),
+        "critical": int((frame["الخطورة"] == "حرج").sum()) if not frame.empty else 0,
+        "avg_diff": round(float(frame["الفرق"].abs().mean()), 2) if not frame.empty else 0,
+        "competitors": attrs.get("competitors", 1),
+    }
+    return sections
+
+def _parse_verdict(text):
+    """استخراج {"is_match", "reason"} من رد النموذج (قد يكون داخل ```json)"""
+    if not text:
+        return None
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end <= start:
+        return None
+    try:
+        verdict = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    return verdict if isinstance(verdict, dict) and "is_match" in verdict else None
+
+AI_BATCH_SIZE = 20  # عدد الأزواج في كل طلب
+AI_OUTAGE_LIMIT = 3       # إخفاقات نقل متتالية (انقطاع/مهلة/5xx) قبل إيقاف طلبات التحقق
+AI_OUTAGE_COOLDOWN = 60   # ثوانٍ قبل تجربة طلب واحد من جديد
+AI_VERIFY_TIMEOUT = 30    # مهلة طلب التحقق (دفعة أو زوج منفرد)
+
+def _unverified():
+    """حكم زوج مشكوك فيه لم يصل رده: ليس تطابقاً ولا رفضاً"""
+    return {"is_match": None, "reason": "لم يتم التحقق"}
+
+class _OutageBreaker:
+    """قاطع دارة مشترك لكل دفعات التحقق: أثناء انقطاع المزودين تُترك الأزواج بلا حكم فوراً
+    بدل انتظار مهلة كل طلب"""
+
+    def __init__(self, limit=AI_OUTAGE_LIMIT, cooldown=AI_OUTAGE_COOLDOWN):
+        self.limit = limit
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            return time.monotonic() >= self.open_until
+
+    def record(self, ok):
+        with self.lock:
+            if ok:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= self.limit:
+                self.open_until = time.monotonic() + self.cooldown
+                self.failures = self.limit - 1  # بعد المهلة: إخفاق واحد آخر يعيد الفتح
+
+_ai_breaker = _OutageBreaker()
+
+def _parse_verdict_list(text):
+    """{id: الحكم} من رد دفعة: {"verdicts": [...]} أو مصفوفة JSON مباشرة"""
+    if not text:
+        return {}
+    start = min((i for i in (text.find('{'), text.find('[')) if i >= 0), default=-1)
+    end = max(text.rfind('}'), text.rfind(']'))
+    if start < 0 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if isinstance(data, dict):
+        data = data.get("verdicts", [])
+    verdicts = {}
+    for item in data if isinstance(data, list) else []:
+        if isinstance(item, dict) and "id" in item and isinstance(item.get("is_match"), bool):
+            try:
+                verdicts[int(item["id"])] = {"is_match": item["is_match"], "reason": str(item.get("reason", ""))}
+            except (TypeError, ValueError):
+                continue
+    return verdicts
+
+_BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "match_verdicts",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"verdicts": {"type": "array", "items": {
+                "type": "object",
+                "properties": {"id": {"type": "integer"}, "is_match": {"type": "boolean"}, "reason": {"type": "string"}},
+                "required": ["id", "is_match", "reason"],
+                "additionalProperties": False,
+            }}},
+            "required": ["verdicts"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+def _verify_batch_request(pairs):
+    """طلب واحد لعدة أزواج؛ المعرفات المحلية 0..n-1 تربط كل حكم بزوجه
+
+    None = لا رد (انقطاع/مهلة/5xx بعد إعادة المحاولة والمزود الاحتياطي)، {} أو جزء = رد لم يُفهم كله
+    """
+    items = [{"id": n, "ours": p["my_name"], "our_price": p["my_price"],
+              "competitor": p["comp_name"], "competitor_price": p["comp_price"]} for n, p in enumerate(pairs)]
+    prompt = ("قارن كخبير عطور كل زوج في القائمة التالية: هل منتجنا (ours) ومنتج المنافس (competitor) "
+              "نفس العطر والحجم والتركيز؟\n"
+              f"{json.dumps(items, ensure_ascii=False, default=str)}\n"
+              'رد فقط بـ JSON بالشكل: {"verdicts": [{"id": int, "is_match": bool, "reason": str}]} '
+              "وبحكم واحد لكل id.")
+    text = _ai_chat(prompt, timeout=AI_VERIFY_TIMEOUT, response_format=_BATCH_RESPONSE_FORMAT)
+    return None if text is None else _parse_verdict_list(text)
+
+def verify_pairs_batch(pairs, batch_size=AI_BATCH_SIZE):
+    """التحقق من أزواج مشكوك فيها على دفعات؛ تعيد {id: الحكم} للأزواج التي نجح التحقق منها
+
+    pairs: [{"id", "my_name", "comp_name", "my_price", "comp_price", "score"}]
+    الأزواج التي لم يُفهم حكمها فقط تُعاد: جزء من الدفعة ← يُرسل وحده، الدفعة كلها ← تُقسم نصفين،
+    زوج واحد ← طلب فردي. عطل النقل لا يُقسَّم (يضاعف الطلبات على مزود متعطل) وتبقى أزواجه بلا حكم،
+    وبعد AI_OUTAGE_LIMIT أعطال متتالية يتوقف التحقق حتى تنتهي AI_OUTAGE_COOLDOWN.
+    """
+    cache = get_pair_cache()
+    verdicts, pending = {}, []
+    for p in pairs:
+        key = pair_key(p["my_name"], p["comp_name"], p["my_price"], p["comp_price"])
+        cached = cache.get(key)
+        if cached:
+            verdicts[p["id"]] = cached[1]
+        else:
+            pending.append((key, p))
+
+    queue = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    while queue and _ai_breaker.allow():
+        batch = queue.pop()
+        if len(batch) == 1:
+            key, p = batch[0]
+            text = train_and_verify_ai(p["my_name"], p["comp_name"], p["my_price"], p["comp_price"])
+            _ai_breaker.record(text is not None)
+            verdict = _parse_verdict(text)
+            if verdict is not None:
+                verdicts[p["id"]] = verdict
+                cache.put(key, p.get("score"), verdict)
+            continue
+
+        answered = _verify_batch_request([p for _, p in batch])
+        _ai_breaker.record(answered is not None)
+        if answered is None:
+            continue
+        failed = []
+        for n, (key, p) in enumerate(batch):
+            if n in answered:
+                verdicts[p["id"]] = answered[n]
+                cache.put(key, p.get("score"), answered[n])
+            else:
+                failed.append((key, p))
+        if len(failed) == len(batch):
+            mid = len(failed) // 2
+            queue.extend([failed[:mid], failed[mid:]])
+        elif failed:
+            queue.append(failed)
+    return verdicts
+
+def verify_pairs_concurrently(pairs, batch_size=AI_BATCH_SIZE, profiler=None):
+    """verify_pairs_batch مع إرسال الدفعات بالتوازي (ضمن حدود المزود)"""
+    with VerificationPipeline(verify_pairs_batch, batch_size=batch_size, profiler=profiler) as pipeline:
+        for pair in pairs:
+            pipeline.submit(pair)
+    return pipeline.verdicts
+
+def _openrouter_chat(prompt, timeout=5, response_format=None):
+    """طلب OpenRouter واحد؛ يعيد نص الرد أو None عند الفشل"""
     api_key = st.secrets.get("OPENROUTER_API_KEY", "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")
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    
-    prompt = f"قارن كخبير عطور: منتجنا ({my_name}) بسعر {my_price} والمنافس ({comp_name}) بسعر {comp_price}. هل هما نفس العطر والحجم والتركيز؟ رد بـ JSON: {{'is_match': bool, 'reason': str}}"
+    # قابل للتغيير لخادم محلي بديل أثناء الاختبار
+    url = os.environ.get("OPENROUTER_URL") or st.secrets.get("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+    payload = {
+        "model": "google/gemini-2.0-flash-exp:free",
+        "messages": [{"role": "user", "content": prompt}]
+    }
+    if response_format:
+        payload["response_format"] = response_format
     
     try:
-        res = requests.post(url, headers={"Authorization": f"Bearer {api_key}"}, json={
-            "model": "google/gemini-2.0-flash-exp:free",
-            "messages": [{"role": "user", "content": prompt}]
-        }, timeout=5)
+        def send():
+            with provider_slot("openrouter"):
+                return requests.post(url, headers={"Authorization": f"Bearer {api_key}"}, json=payload, timeout=timeout)
+        # حالة 429 مشتركة مع app.py: احترام Retry-After والتراجع قبل الطلب التالي
+        res = rate_limit.request("openrouter", send, max_retries=2)
         return res.json()['choices'][0]['message']['content']
     except:
         return None
+
+def _gemini_chat(prompt, timeout=5, response_format=None):
+    """طلب Gemini واحد (احتياطي للتحقق)؛ يعيد نص الرد أو None عند الفشل"""
+    api_key = st.secrets.get("GEMINI_API_KEY", "")
+    if not api_key:
+        return None
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={api_key}"
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    if response_format:
+        payload["generationConfig"] = {"responseMimeType": "application/json"}
+    
+    try:
+        def send():
+            with provider_slot("gemini"):
+                return requests.post(url, json=payload, timeout=timeout)
+        res = rate_limit.request("gemini", send, max_retries=2)
+        return res.json()["candidates"][0]["content"]["parts"][0]["text"]
+    except:
+        return None
+
+def _as_result(chat):
+    """تحويل دالة (نص أو None) إلى مزود بصيغة ai_router"""
+    def provider(prompt, **kwargs):
+        text = chat(prompt, **kwargs)
+        return {"success": True, "text": text} if text else {"success": False, "error": "لا يوجد رد"}
+    return provider
+
+_VERIFY_PROVIDERS = {"openrouter": _as_result(_openrouter_chat), "gemini": _as_result(_gemini_chat)}
+
+def _ai_chat(prompt, timeout=5, response_format=None):
+    """طلب تحقق عبر الموجّه: OpenRouter أولاً، وطلب احتياطي لـ Gemini إذا تأخر عن p95"""
+    providers = dict(_VERIFY_PROVIDERS)
+    if not st.secrets.get("GEMINI_API_KEY", ""):
+        providers.pop("gemini")
+    result = get_router().call(prompt, "verify", providers=providers,
+                               timeout=timeout, response_format=response_format)
+    return result.get("text") if result.get("success") else None
+
+def train_and_verify_ai(my_name, comp_name, my_price, comp_price):
+    """خبير العطور المدرب عبر OpenRouter"""
+    prompt = f"قارن كخبير عطور: منتجنا ({my_name}) بسعر {my_price} والمنافس ({comp_name}) بسعر {comp_price}. هل هما نفس العطر والحجم والتركيز؟ رد بـ JSON: {{'is_match': bool, 'reason': str}}"
+    return _ai_chat(prompt, timeout=AI_VERIFY_TIMEOUT)
@@ -0,0 +1,46 @@
+"""
+export.py
+كتابة السجلات إلى Excel كتدفق صفحة بصفحة (openpyxl write_only) دون تحميل الجدول كاملاً في الذاكرة
+"""
+
+import json
+import os
+import tempfile
+
+
+def _cell(value):
+    # القيم المركبة (JSONB) تُكتب كنص
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+def write_xlsx_stream(pages, path, sheet_name="Sheet1", columns=None):
+    """كتابة صفحات من السجلات (قوائم dict) إلى ملف xlsx؛ تعيد عدد الصفوف المكتوبة"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_name)
+    count = 0
+    for rows in pages:
+        for row in rows:
+            if columns is None:
+                columns = list(row.keys())
+                ws.append(columns)
+            ws.append([_cell(row.get(c)) for c in columns])
+            count += 1
+    if columns is None:
+        ws.append([])
+    wb.save(path)
+    return count
+
+
+def export_to_temp_xlsx(pages, sheet_name="Sheet1", columns=None, prefix="export_"):
+    """نفس write_xlsx_stream إلى ملف مؤقت؛ تعيد (المسار، عدد الصفوف)"""
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=".xlsx")
+    os.close(fd)
+    try:
+        return path, write_xlsx_stream(pages, path, sheet_name, columns)
+    except Exception:
+        os.remove(path)
+        raise
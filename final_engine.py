@@ -1,32 +1,100 @@
 import pandas as pd
 from rapidfuzz import fuzz, process
-from collections import defaultdict
 import streamlit as st
 # استيراد مباشر (بدون modules)
 from db_manager import DatabaseManager
+from token_index import get_or_build_index
+from normalizer import normalize_name, is_compatible
+from checkpoint import CheckpointStore
+from profiling import StageProfiler
 
-def preprocess_competitors(comp_df):
-    index = defaultdict(list)
-    for _, row in comp_df.iterrows():
-        # تحديد اسم العمود بذكاء
-        name_col = 'name' if 'name' in row else (row.keys()[0] if len(row) > 0 else 'name')
-        val = str(row.get(name_col, '')).lower()
-        key = val.split()[0] if val else 'other' # أول كلمة كـ مفتاح
-        
+def preprocess_competitors(comp_df, max_candidates=200, max_df_ratio=0.05):
+    """بناء (أو تحميل) الفهرس المقلوب لأسماء المنافسين"""
+    # تحديد اسم العمود بذكاء
+    name_col = 'name' if 'name' in comp_df.columns else (comp_df.columns[0] if len(comp_df.columns) > 0 else 'name')
+    infos = [normalize_name(str(v)) for v in comp_df[name_col].tolist()] if name_col in comp_df.columns else []
+    names = [info.canonical for info in infos]
+
+    index = get_or_build_index(names, max_candidates=max_candidates, max_df_ratio=max_df_ratio)
+    index.items = []
+    for pos, (_, row) in enumerate(comp_df.iterrows()):
         item = row.to_dict()
-        item['search_name'] = val
-        index[key].append(item)
-        index['all'].append(item)
+        item['search_name'] = names[pos]
+        item['info'] = infos[pos]
+        index.items.append(item)
     return index
 
-def run_super_analysis(my_df, comp_df, threshold=60):
+def _match_row(row, comp_index, my_col, price_col, threshold, profiler=None):
+    """مطابقة منتج واحد من ملفك مع المرشحين من الفهرس"""
+    profiler = profiler or StageProfiler()
+    with profiler.span("normalize", items=1):
+        my_info = normalize_name(str(row.get(my_col, '')))
+    my_name = my_info.canonical
+    
+    # البحث فقط في المنافسين الذين يشاركون كلمة نادرة ومتوافقين في الحجم والتركيز (للسرعة)
+    with profiler.span("candidates", items=1):
+        candidates = [comp_index.items[i] for i in comp_index.candidates(my_name)]
+        candidates = [c for c in candidates if is_compatible(my_info, c['info'])]
+    
+    best_match = None
+    best_score = 0
+    
+    if candidates:
+        choices = [c['search_name'] for c in candidates]
+        with profiler.span("fuzzy", items=len(choices)):
+            match = process.extractOne(my_name, choices, scorer=fuzz.token_sort_ratio)
+        if match and match[1] >= threshold:
+            best_score = match[1]
+            best_match = candidates[match[2]]
+
+    # تجهيز النتيجة
+    comp_price = 0
+    if best_match:
+        # محاولة استخراج السعر من المنافس
+        for k, v in best_match.items():
+            if 'price' in str(k).lower() or 'سعر' in str(k):
+                try: comp_price = float(v)
+                except: pass
+                break
+    
+    my_price = 0
+    try: my_price = float(row.get(price_col, 0))
+    except: pass
+
+    res = {
+        "my_product": row.get(my_col),
+        "my_price": my_price,
+        "comp_product": best_match.get('search_name') if best_match else None,
+        "comp_price": comp_price,
+        "confidence": best_score,
+        "status": "matched" if best_match else "missing"
+    }
+    
+    if res['status'] == 'matched':
+        diff = res['comp_price'] - res['my_price']
+        res['diff'] = diff
+        if diff > 0: res['decision'] = "رفع السعر 🔴"
+        elif diff < 0: res['decision'] = "خفض السعر 🟡"
+        else: res['decision'] = "سعر ممتاز 🟢"
+    else:
+        res['decision'] = "مفقود 🔵"
+    return res
+
+def run_super_analysis(my_df, comp_df, threshold=60, max_candidates=200, chunk_size=500):
+    profiler = StageProfiler()
     db = DatabaseManager()
-    processed_count = db.get_progress()
+
+    # نقاط الاستئناف: نفس الملفات والإعدادات تستأنف من آخر دفعة مكتملة
+    run_key = CheckpointStore.make_run_key(my_df, comp_df, chunk_size, threshold=threshold, max_candidates=max_candidates)
+    checkpoints = CheckpointStore(run_key)
+    done_chunks = checkpoints.completed_chunks()
     
-    if processed_count > 0:
-        st.success(f"⏩ تم استئناف العمل وتخطي {processed_count} منتج!")
+    if done_chunks:
+        skipped = sum(len(r) for r in done_chunks.values())
+        st.success(f"⏩ تم استئناف العمل وتخطي {skipped} منتج!")
 
-    comp_index = preprocess_competitors(comp_df)
+    with profiler.span("index", items=len(comp_df)):
+        comp_index = preprocess_competitors(comp_df, max_candidates=max_candidates)
     results = []
     
     progress_bar = st.progress(0)
@@ -37,62 +105,50 @@ def run_super_analysis(my_df, comp_df, threshold=60):
     my_col = 'name' if 'name' in my_df.columns else my_df.columns[0]
     price_col = 'price' if 'price' in my_df.columns else (my_df.columns[1] if len(my_df.columns)>1 else None)
 
-    for idx, row in my_df.iterrows():
-        if idx < processed_count: continue
-
-        my_name = str(row.get(my_col, '')).lower()
-        key = my_name.split()[0] if my_name else 'other'
-        
-        # البحث في نفس المجموعة فقط (للسرعة)
-        candidates = comp_index.get(key, []) or comp_index.get('all', [])
-        
-        best_match = None
-        best_score = 0
-        
-        if candidates:
-            choices = [c['search_name'] for c in candidates]
-            match = process.extractOne(my_name, choices, scorer=fuzz.token_sort_ratio)
-            if match and match[1] >= threshold:
-                best_score = match[1]
-                best_match = candidates[match[2]]
-
-        # تجهيز النتيجة
-        comp_price = 0
-        if best_match:
-            # محاولة استخراج السعر من المنافس
-            for k, v in best_match.items():
-                if 'price' in str(k).lower() or 'سعر' in str(k):
-                    try: comp_price = float(v)
-                    except: pass
-                    break
-        
-        my_price = 0
-        try: my_price = float(row.get(price_col, 0))
-        except: pass
-
-        res = {
-            "my_product": row.get(my_col),
-            "my_price": my_price,
-            "comp_product": best_match.get('search_name') if best_match else None,
-            "comp_price": comp_price,
-            "confidence": best_score,
-            "status": "matched" if best_match else "missing"
-        }
-        
-        if res['status'] == 'matched':
-            diff = res['comp_price'] - res['my_price']
-            res['diff'] = diff
-            if diff > 0: res['decision'] = "رفع السعر 🔴"
-            elif diff < 0: res['decision'] = "خفض السعر 🟡"
-            else: res['decision'] = "سعر ممتاز 🟢"
+    for chunk_no, start in enumerate(range(0, total, chunk_size)):
+        if chunk_no in done_chunks:
+            results.extend(done_chunks[chunk_no])
+            continue
+
+        chunk_results = []
+        for _, row in my_df.iloc[start:start + chunk_size].iterrows():
+            res = _match_row(row, comp_index, my_col, price_col, threshold, profiler)
+            with profiler.span("db_write", items=1):
+                db.save_match(res['my_product'], res['comp_product'], res)
+            chunk_results.append(res)
+
+        # نتائج الدفعة في Supabase قبل تسجيلها مكتملة (الاستئناف لا يتخطى صفوفاً لم تُكتب)
+        with profiler.span("db_write"):
+            failed = db.flush()
+
+        # حفظ الدفعة كاملة مرة واحدة (فقط إذا كُتبت كل صفوفها؛ وإلا تُعاد الدفعة عند الاستئناف)
+        if failed:
+            st.warning(f"⚠️ تعذر حفظ {failed} نتيجة من الدفعة {chunk_no + 1} في Supabase — لن تُسجل كنقطة استئناف")
         else:
-            res['decision'] = "مفقود 🔵"
+            with profiler.span("checkpoint", items=len(chunk_results)):
+                checkpoints.save_chunk(chunk_no, chunk_results)
+        results.extend(chunk_results)
+
+        done = min(start + chunk_size, total)
+        progress_bar.progress(done / total)
+        status_text.text(f"جاري العمل: {done}/{total}")
+
+    # آخر دفعة من نتائج Supabase المؤقتة
+    with profiler.span("db_write"):
+        db.close()
 
-        db.save_match(res['my_product'], res['comp_product'], res)
-        results.append(res)
+    # اكتمل التشغيل: لا حاجة لنقاط الاستئناف
+    checkpoints.clear()
+    checkpoints.close()
 
-        if idx % 5 == 0:
-            progress_bar.progress((idx + 1) / total)
-            status_text.text(f"جاري العمل: {idx+1}/{total}")
+    # تقرير أداء الفهرس لضبط الإعدادات
+    index_stats = comp_index.report()
+    st.caption(f"🔎 الفهرس: متوسط المرشحين {index_stats['avg_candidates']} من {index_stats['rows']} | "
+               f"نسبة الإصابة {index_stats['hit_rate']}% | بدون مرشحين {index_stats['empty']}")
 
-    return pd.DataFrame(results)
\ No newline at end of file
+    df = pd.DataFrame(results)
+    df.attrs["index_stats"] = index_stats
+    df.attrs["profile"] = profiler.summary()
+    with st.expander("⏱️ أداء التحليل"):
+        st.dataframe(pd.DataFrame(df.attrs["profile"]["stages"]), use_container_width=True)
+    return df
\ No newline at end of file
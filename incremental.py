@@ -0,0 +1,132 @@
+"""
+incremental.py
+إعادة التحليل التزايدي: بصمة محتوى لكل صف متجر ومنافس مع آخر نتيجة مطابقة
+تُعاد مطابقة الصفوف المتغيرة فقط، وتُستخدم النتائج المحفوظة لبقية الصفوف
+"""
+
+import hashlib
+import json
+
+import local_store
+from matcher import match_top_k
+from normalizer import is_compatible
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inc_comp_rows (
+    scope TEXT NOT NULL,
+    comp_hash TEXT NOT NULL,
+    PRIMARY KEY (scope, comp_hash)
+);
+CREATE TABLE IF NOT EXISTS inc_store_rows (
+    scope TEXT NOT NULL,
+    store_hash TEXT NOT NULL,
+    comp_hash TEXT,
+    score REAL NOT NULL DEFAULT 0,
+    result_json TEXT,
+    PRIMARY KEY (scope, store_hash)
+);
+CREATE TABLE IF NOT EXISTS inc_scopes (
+    scope TEXT PRIMARY KEY,
+    settings TEXT NOT NULL
+);
+"""
+
+
+def row_hash(*values):
+    """بصمة محتوى صف كامل (تتغير بتغير الاسم أو السعر أو أي عمود)"""
+    digest = hashlib.sha1()
+    for v in values:
+        digest.update(str(v).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()[:20]
+
+
+def _json_default(obj):
+    # أنواع NumPy (int64, float64) تتحول إلى أنواع بايثون
+    return obj.item() if hasattr(obj, "item") else str(obj)
+
+
+class IncrementalState:
+    """حالة آخر تشغيل لنطاق واحد (مثلاً: ملف منافس محدد)
+
+    settings: إعدادات المطابقة التي تحدد النتائج (threshold، top_k)؛ تغيّرها يُبطل الحالة المحفوظة
+    """
+
+    def __init__(self, scope, path=None, **settings):
+        self.scope = scope
+        self.settings = json.dumps(settings, sort_keys=True, default=str)
+        self.conn = local_store.connect(path)
+        self.conn.executescript(_SCHEMA)
+        self.stats = {"reused": 0, "rescored": 0, "new_comp_rows": 0}
+        self._check_settings()
+
+    def _check_settings(self):
+        """نتائج محفوظة بإعدادات مختلفة (أو بلا إعدادات مسجلة) لا يُعاد استخدامها"""
+        row = self.conn.execute("SELECT settings FROM inc_scopes WHERE scope = ?", (self.scope,)).fetchone()
+        if (row[0] if row else None) != self.settings:
+            with self.conn:
+                self.conn.execute("DELETE FROM inc_comp_rows WHERE scope = ?", (self.scope,))
+                self.conn.execute("DELETE FROM inc_store_rows WHERE scope = ?", (self.scope,))
+
+    def load(self):
+        """بصمات المنافس السابقة + {بصمة صف المتجر: (بصمة المنافس المطابق, الثقة, النتيجة)}"""
+        comp = {h for (h,) in self.conn.execute(
+            "SELECT comp_hash FROM inc_comp_rows WHERE scope = ?", (self.scope,))}
+        store = {}
+        for store_hash, comp_hash, score, result_json in self.conn.execute(
+                "SELECT store_hash, comp_hash, score, result_json FROM inc_store_rows WHERE scope = ?",
+                (self.scope,)):
+            store[store_hash] = (comp_hash, score, json.loads(result_json) if result_json else None)
+        return comp, store
+
+    def plan(self, store_hashes, store_infos, comp_hashes, comp_infos, threshold=60, top_k=5):
+        """تحديد صفوف المتجر التي تحتاج إعادة مطابقة.
+
+        يُعاد استخدام نتيجة الصف إذا لم تتغير بصمته، وبقي منافسه المطابق كما هو،
+        ولم يظهر صف منافس جديد يتفوق على ثقته السابقة.
+        تعيد (rescore: قائمة مواقع, reused: {موقع: (بصمة المنافس, الثقة, النتيجة)})
+        """
+        prev_comp, prev_store = self.load()
+        current_comp = set(comp_hashes)
+        new_comp = [j for j, h in enumerate(comp_hashes) if h not in prev_comp]
+
+        reusable = [pos for pos, h in enumerate(store_hashes)
+                    if h in prev_store and (prev_store[h][0] is None or prev_store[h][0] in current_comp)]
+
+        # مقارنة الصفوف القابلة لإعادة الاستخدام مع صفوف المنافس الجديدة/المتغيرة فقط
+        beaten = set()
+        if new_comp and reusable:
+            delta_idx, delta_scores = match_top_k([store_infos[p].canonical for p in reusable],
+                                                  [comp_infos[j].canonical for j in new_comp],
+                                                  threshold=threshold, top_k=top_k)
+            for i, pos in enumerate(reusable):
+                prev_score = prev_store[store_hashes[pos]][1] or 0
+                for j, sc in zip(delta_idx[i], delta_scores[i]):
+                    if j >= 0 and is_compatible(store_infos[pos], comp_infos[new_comp[j]]):
+                        if sc > prev_score:
+                            beaten.add(pos)
+                        break
+
+        reused = {pos: prev_store[store_hashes[pos]] for pos in reusable if pos not in beaten}
+        rescore = [pos for pos in range(len(store_hashes)) if pos not in reused]
+        self.stats = {"reused": len(reused), "rescored": len(rescore), "new_comp_rows": len(new_comp)}
+        return rescore, reused
+
+    def save(self, comp_hashes, store_entries):
+        """استبدال حالة النطاق بحالة التشغيل الحالي في معاملة واحدة"""
+        with self.conn:
+            self.conn.execute("DELETE FROM inc_comp_rows WHERE scope = ?", (self.scope,))
+            self.conn.execute("DELETE FROM inc_store_rows WHERE scope = ?", (self.scope,))
+            self.conn.execute("INSERT OR REPLACE INTO inc_scopes (scope, settings) VALUES (?, ?)",
+                              (self.scope, self.settings))
+            self.conn.executemany("INSERT OR IGNORE INTO inc_comp_rows (scope, comp_hash) VALUES (?, ?)",
+                                  ((self.scope, h) for h in set(comp_hashes)))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO inc_store_rows (scope, store_hash, comp_hash, score, result_json) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((self.scope, h, comp_hash, float(score or 0),
+                  json.dumps(result, ensure_ascii=False, default=_json_default) if result is not None else None)
+                 for h, (comp_hash, score, result) in store_entries.items()))
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,133 @@
+"""
+ingest.py
+قراءة ملفات المنافسين (Excel/CSV) كتدفق من السجلات الموحدة على دفعات
+الذاكرة ثابتة تقريباً مهما كبر حجم الملف
+"""
+
+import os
+from io import BytesIO
+from typing import NamedTuple
+
+import pandas as pd
+
+import upload_cache
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class Record(NamedTuple):
+    name: str
+    price: float
+    sku: str
+    source: str
+
+
+def _to_float(val):
+    try:
+        return float(str(val).replace(",", ""))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _detect_columns(header):
+    """تحديد أعمدة الاسم والسعر والرمز من صف العناوين (أرقام الأعمدة)"""
+    labels = [str(h or "").strip().lower() for h in header]
+
+    def find(*keys):
+        return next((i for i, h in enumerate(labels) if any(k in h for k in keys)), None)
+
+    name_col = find("name", "اسم")
+    price_col = find("price", "سعر")
+    sku_col = find("sku", "رمز", "barcode", "باركود")
+    if name_col is None:
+        name_col = 0
+    if price_col is None and len(labels) > 1:
+        price_col = 1 if name_col != 1 else None
+    return name_col, price_col, sku_col
+
+
+def _make_record(values, cols, source):
+    name_col, price_col, sku_col = cols
+
+    def get(i):
+        return values[i] if i is not None and i < len(values) else None
+
+    name = get(name_col)
+    if name is None or (isinstance(name, float) and pd.isna(name)) or str(name).strip() == "":
+        return None
+    sku = get(sku_col)
+    return Record(str(name).strip(), _to_float(get(price_col)), "" if sku is None else str(sku), source)
+
+
+def _open_source(file_info):
+    """مصدر البيانات: مسار على القرص أو bytes مرفوعة"""
+    if file_info.get("path"):
+        return file_info["path"]
+    return BytesIO(file_info["data"])
+
+
+def _iter_csv(file_info, chunk_size):
+    source = file_info["name"]
+    cols = None
+    for chunk in pd.read_csv(_open_source(file_info), chunksize=chunk_size, dtype=str, keep_default_na=False):
+        if cols is None:
+            cols = _detect_columns(chunk.columns)
+        records = [_make_record(values, cols, source) for values in chunk.itertuples(index=False, name=None)]
+        yield [r for r in records if r]
+
+
+def _iter_xlsx(file_info, chunk_size):
+    from openpyxl import load_workbook
+
+    source = file_info["name"]
+    wb = load_workbook(_open_source(file_info), read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        cols = _detect_columns(header)
+        batch = []
+        for values in rows:
+            record = _make_record(values, cols, source)
+            if record:
+                batch.append(record)
+            if len(batch) >= chunk_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        wb.close()
+
+
+def iter_record_chunks(file_info, chunk_size=DEFAULT_CHUNK_SIZE, use_cache=True):
+    """تدفق دفعات من Record لملف منافس {"name", "data"} أو {"name", "path"}
+
+    الملفات المرفوعة كـ bytes تُحفظ بعد أول قراءة كـ Parquet؛ نفس المحتوى لاحقاً يُقرأ منه مباشرة.
+    """
+    source = file_info["name"]
+    ext = os.path.splitext(str(source).lower())[1]
+    parser = _iter_csv if ext == ".csv" else _iter_xlsx
+
+    digest = None
+    if use_cache and upload_cache.PARQUET_AVAILABLE and file_info.get("data") is not None:
+        digest = upload_cache.file_digest(file_info["data"])
+        cached = upload_cache.lookup(digest)
+        if cached:
+            for rows in upload_cache.read_batches(cached, chunk_size):
+                yield [Record(name, price, sku, source) for name, price, sku in rows]
+            return
+
+    if digest is None:
+        yield from parser(file_info, chunk_size)
+        return
+
+    writer = upload_cache.CacheWriter(digest)
+    try:
+        for batch in parser(file_info, chunk_size):
+            writer.write(batch)
+            yield batch
+        writer.commit()
+    finally:
+        writer.abort()
@@ -0,0 +1,22 @@
+"""
+local_store.py
+قاعدة SQLite محلية بجانب التطبيق للحالة التي يجب أن تبقى بين التشغيلات
+(بصمات الصفوف، نقاط الاستئناف، الذاكرة المؤقتة)
+"""
+
+import os
+import sqlite3
+
+# LOCAL_STORE_DIR: مجلد بديل (مثلاً للقياس)؛ يُورَّث للعمليات الفرعية عكس تعديل المتغيرات في الذاكرة
+CACHE_DIR = os.environ.get("LOCAL_STORE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+DB_PATH = os.path.join(CACHE_DIR, "local_store.db")
+
+
+def connect(path=None):
+    """فتح اتصال SQLite (WAL) صالح للاستخدام من عدة خيوط وعمليات"""
+    path = path or DB_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
@@ -0,0 +1,65 @@
+"""
+matcher.py
+مطابقة مصفوفية (كثير × كثير) لأسماء المنتجات عبر RapidFuzz cdist
+"""
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# حجم البلاطة: عدد صفوف المتجر × عدد أسماء المنافس في كل استدعاء cdist
+# (1000 × 10000 × float32 ≈ 40MB كحد أقصى للذاكرة لكل بلاطة)
+QUERY_TILE_SIZE = 1000
+CHOICE_TILE_SIZE = 10000
+
+
+def _select_top_k(indices, scores, k):
+    """اختيار أفضل K عمود لكل صف مرتبة تنازلياً (الأقل فهرساً أولاً عند التعادل)"""
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        indices = np.take_along_axis(indices, part, axis=1)
+    order = np.lexsort((indices, -scores), axis=1)
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def match_top_k(queries, choices, threshold=60, top_k=5, scorer=fuzz.token_sort_ratio,
+                workers=-1, query_tile_size=QUERY_TILE_SIZE, choice_tile_size=CHOICE_TILE_SIZE):
+    """مطابقة جميع أسماء المتجر مع جميع أسماء المنافس دفعة واحدة.
+
+    تعيد (indices, scores) بشكل (len(queries), top_k):
+    الفهرس -1 يعني عدم وجود مرشح يتجاوز حد التطابق.
+    """
+    n = len(queries)
+    k = max(1, top_k)
+    best_idx = np.full((n, k), -1, dtype=np.int64)
+    best_scores = np.zeros((n, k), dtype=np.float32)
+    if n == 0 or len(choices) == 0:
+        return best_idx, best_scores
+
+    choices = list(choices)
+    for q_start in range(0, n, query_tile_size):
+        tile = queries[q_start:q_start + query_tile_size]
+        tile_idx = best_idx[q_start:q_start + len(tile)]
+        tile_scores = best_scores[q_start:q_start + len(tile)]
+
+        for c_start in range(0, len(choices), choice_tile_size):
+            block = choices[c_start:c_start + choice_tile_size]
+            # score_cutoff: أي نتيجة أقل من الحد تعود 0 دون حسابها بالكامل
+            matrix = process.cdist(tile, block, scorer=scorer, score_cutoff=threshold,
+                                   workers=workers, dtype=np.float32)
+            block_idx = np.broadcast_to(np.arange(c_start, c_start + len(block)), matrix.shape)
+
+            # دمج أفضل K الحالية مع البلاطة الجديدة
+            tile_idx, tile_scores = _select_top_k(
+                np.concatenate([tile_idx, block_idx], axis=1),
+                np.concatenate([tile_scores, matrix], axis=1),
+                k,
+            )
+
+        # المرشحون تحت الحد (أو الخانات الفارغة) تُعلَّم بـ -1
+        tile_idx = np.where((tile_scores >= threshold) & (tile_scores > 0), tile_idx, -1)
+        tile_scores = np.where(tile_idx >= 0, tile_scores, 0)
+        best_idx[q_start:q_start + len(tile)] = tile_idx
+        best_scores[q_start:q_start + len(tile)] = tile_scores
+
+    return best_idx, best_scores
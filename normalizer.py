@@ -0,0 +1,155 @@
+"""
+normalizer.py
+توحيد أسماء العطور واستخراج خصائصها (الحجم، التركيز، تستر، طقم، الماركة)
+يُنفَّذ مرة واحدة لكل اسم فريد بفضل lru_cache
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+import pandas as pd
+
+BRANDS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "brands.csv")
+
+
+class ProductInfo(NamedTuple):
+    canonical: str                  # الاسم الموحد المستخدم في المطابقة
+    size_ml: Optional[float]        # الحجم بالمليلتر
+    concentration: Optional[str]    # edp / edt / edc / parfum / extrait
+    is_tester: bool
+    is_set: bool
+    brand: Optional[str]
+
+
+# ── توحيد الحروف ─────────────────────────────────────────────
+_CHAR_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه",
+    "٫": ".", "٬": ",",
+    **{chr(0x0660 + d): str(d) for d in range(10)},  # أرقام عربية-هندية
+    **{chr(0x06F0 + d): str(d) for d in range(10)},  # أرقام فارسية
+})
+_DIACRITICS_RE = re.compile(r"[\u064B-\u0652\u0670\u0640]")  # تشكيل + تطويل
+
+# حدود الكلمة للنص العربي/الإنجليزي المختلط
+_WB_START = r"(?<![a-z\u0600-\u06FF])"
+_WB_END = r"(?![a-z\u0600-\u06FF])"
+
+# ── الحجم ────────────────────────────────────────────────────
+_SIZE_RE = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(ml|m\.l|مل|ملي|ملل|مليلتر|ميلي|oz|fl\.?\s*oz|اونصه)" + _WB_END
+)
+_OZ_TO_ML = 29.5735
+
+# ── التركيز (الترتيب مهم: الأطول أولاً) ──────────────────────
+_CONCENTRATION_PATTERNS = [
+    ("extrait", r"extrait(?: de parfum)?|اكستريت|اكسترايت"),
+    ("edp", r"eau de parfum|edp|(?:او|اي)\s*د[ويو]\s*بار?ف[يا]?(?:يوم|وم|ان|ام)|ماء العطر"),
+    ("edt", r"eau de toilette|edt|(?:او|اي)\s*د[ويو]\s*تو[ا]?ليت|تواليت"),
+    ("edc", r"eau de cologne|edc|(?:او|اي)\s*د[ويو]\s*كولون[يا]?|كولونيا"),
+    ("parfum", r"parfum|perfume extract|بارفيوم|بارفان"),
+]
+_CONCENTRATION_RES = [(code, re.compile(_WB_START + f"(?:{p})" + _WB_END))
+                      for code, p in _CONCENTRATION_PATTERNS]
+
+_TESTER_RE = re.compile(_WB_START + r"(?:tester|testers|تستر|تيستر)" + _WB_END)
+_SET_RE = re.compile(_WB_START + r"(?:gift set|set|coffret|طقم|مجموعه|بوكس)" + _WB_END)
+
+# كلمات لا تميّز المنتج وتُحذف من الاسم الموحد
+_NOISE_RE = re.compile(_WB_START + r"(?:عطر|perfume|fragrance|spray|سبراي|بخاخ)" + _WB_END)
+_PUNCT_RE = re.compile(r"[^\w.\s]|_")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """توحيد الحروف العربية والأرقام وإزالة التشكيل والرموز"""
+    text = str(text or "").lower().translate(_CHAR_MAP)
+    text = _DIACRITICS_RE.sub("", text)
+    text = _PUNCT_RE.sub(" ", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+def _load_brand_terms():
+    """تحميل الماركات من ملف سلة (عربي + إنجليزي) مرتبة بالأطول أولاً"""
+    try:
+        df = pd.read_csv(BRANDS_CSV)
+    except Exception:
+        return []
+    terms = []
+    for b in df["اسم الماركة"].dropna().tolist():
+        b = str(b).strip()
+        for part in [b] + (b.split("|") if "|" in b else []):
+            term = normalize_text(part)
+            if len(term) >= 2:
+                terms.append((term, b))
+    terms.sort(key=lambda x: len(x[0]), reverse=True)
+    return terms
+
+
+_BRAND_TERMS = None
+
+
+def _detect_brand(text):
+    global _BRAND_TERMS
+    if _BRAND_TERMS is None:
+        _BRAND_TERMS = _load_brand_terms()
+    padded = f" {text} "
+    for term, brand in _BRAND_TERMS:
+        if f" {term} " in padded:
+            return brand
+    return None
+
+
+@lru_cache(maxsize=200_000)
+def normalize_name(name):
+    """الاسم الموحد + الخصائص المستخرجة لاسم منتج واحد"""
+    text = normalize_text(name)
+
+    size_ml = None
+    size_match = _SIZE_RE.search(text)
+    if size_match:
+        value = float(size_match.group(1))
+        if "oz" in size_match.group(2) or size_match.group(2) == "اونصه":
+            # تقريب لأقرب 5 مل (3.4oz = 100ml و 1.7oz = 50ml في العبوات)
+            value = float(round(value * _OZ_TO_ML / 5) * 5)
+        size_ml = value
+        text = _SIZE_RE.sub(" ", text)
+
+    concentration = None
+    for code, pattern in _CONCENTRATION_RES:
+        if pattern.search(text):
+            concentration = concentration or code
+            text = pattern.sub(" ", text)
+
+    is_tester = bool(_TESTER_RE.search(text))
+    text = _TESTER_RE.sub(" ", text)
+    is_set = bool(_SET_RE.search(text))
+    text = _NOISE_RE.sub(" ", text)
+    text = _SPACES_RE.sub(" ", text).strip()
+
+    brand = _detect_brand(text)
+
+    # الاسم الموحد: الكلمات المميزة + التركيز والحجم بصيغة ثابتة
+    parts = [text]
+    if concentration:
+        parts.append(concentration)
+    if size_ml:
+        parts.append(f"{size_ml:g}ml")
+    if is_tester:
+        parts.append("tester")
+    canonical = " ".join(p for p in parts if p)
+
+    return ProductInfo(canonical, size_ml, concentration, is_tester, is_set, brand)
+
+
+def is_compatible(a, b):
+    """هل يمكن أن يكون المنتجان نفس العطر؟ (خاصية معروفة ومختلفة في الطرفين = لا)"""
+    if a.size_ml and b.size_ml and abs(a.size_ml - b.size_ml) > 0.5:
+        return False
+    if a.concentration and b.concentration and a.concentration != b.concentration:
+        return False
+    if a.brand and b.brand and a.brand != b.brand:
+        return False
+    return a.is_tester == b.is_tester and a.is_set == b.is_set
@@ -0,0 +1,99 @@
+"""
+profiling.py
+قياس زمن مراحل التحليل (قراءة، توحيد، مرشحين، مطابقة، ذكاء اصطناعي، حفظ) بأقل تكلفة
+لكل مرحلة: الزمن الكلي، عدد الاستدعاءات، عدد العناصر
+"""
+
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+# ترتيب العرض في لوحة الأداء (المراحل غير المذكورة تأتي بعدها)
+STAGE_ORDER = ["parse", "normalize", "incremental", "index", "candidates", "fuzzy", "missing",
+               "ai_verify", "ai_backpressure", "ai_wait", "merge", "db_write", "checkpoint"]
+
+STAGE_LABELS = {
+    "parse": "قراءة الملفات",
+    "normalize": "توحيد الأسماء",
+    "incremental": "التحليل التزايدي",
+    "index": "بناء الفهرس",
+    "candidates": "اختيار المرشحين",
+    "fuzzy": "المطابقة النصية",
+    "missing": "المنتجات المفقودة",
+    "ai_verify": "تحقق الذكاء الاصطناعي",
+    "ai_backpressure": "انتظار طابور التحقق (ضغط عكسي)",
+    "ai_wait": "انتظار الذكاء الاصطناعي",
+    "merge": "دمج المنافسين",
+    "db_write": "الحفظ في Supabase",
+    "checkpoint": "نقاط الاستئناف",
+}
+
+
+class StageProfiler:
+    """مجمّع أزمنة المراحل لتشغيل واحد (آمن للاستخدام من عدة خيوط)"""
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds, calls=1, items=0):
+        with self.lock:
+            s = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0, "items": 0})
+            s["seconds"] += seconds
+            s["calls"] += calls
+            s["items"] += items
+
+    def merge(self, stages):
+        """دمج مراحل من عملية أخرى (عامل ملف منافس)؛ أزمنة العمال المتوازية تُجمع فقد تتجاوز الزمن الكلي"""
+        for stage, s in stages.items():
+            self.add(stage, s["seconds"], s["calls"], s["items"])
+
+    @contextmanager
+    def span(self, stage, items=0):
+        """with profiler.span("fuzzy", items=n): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, items=items)
+
+    def summary(self):
+        """ملخص منظم: الزمن الكلي + قائمة المراحل مرتبة"""
+        total = time.perf_counter() - self.started
+        with self.lock:
+            stages = {k: dict(v) for k, v in self.stages.items()}
+        order = {name: i for i, name in enumerate(STAGE_ORDER)}
+        rows = []
+        for name in sorted(stages, key=lambda n: (order.get(n, len(order)), n)):
+            s = stages[name]
+            rows.append({
+                "stage": name,
+                "label": STAGE_LABELS.get(name, name),
+                "seconds": round(s["seconds"], 3),
+                "calls": s["calls"],
+                "items": s["items"],
+                "share": round(s["seconds"] / total * 100, 1) if total else 0.0,
+                "items_per_sec": round(s["items"] / s["seconds"], 1) if s["seconds"] and s["items"] else None,
+            })
+        return {"total_seconds": round(total, 3), "stages": rows}
+
+
+def report_profile(progress_callback, summary, percent=100):
+    """تمرير ملخص الأداء عبر progress_callback(percent, message, profile=...) إذا كان يقبله
+
+    القبول يُحدد من توقيع الدالة (لا من TypeError) فأخطاء الـ callback نفسه تصل للمستدعي
+    """
+    if not progress_callback or not _accepts_profile(progress_callback):
+        return  # callback قديم بدون profile
+    progress_callback(percent, f"⏱️ اكتمل التحليل في {summary['total_seconds']}ث", profile=summary)
+
+
+def _accepts_profile(fn):
+    try:
+        params = inspect.signature(fn).parameters.values()
+    except (TypeError, ValueError):
+        return False  # دوال مدمجة بلا توقيع قابل للقراءة
+    return any(p.name == "profile" and p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)
+               or p.kind == p.VAR_KEYWORD for p in params)
@@ -0,0 +1,97 @@
+"""
+prompt_cache.py
+ذاكرة دائمة لردود Gemini / OpenRouter مفهرسة بالنموذج + بصمة نص الطلب الموحد
+مشتركة بين كل الجلسات لأنها على القرص
+"""
+
+import hashlib
+import re
+import threading
+import time
+
+import local_store
+
+DEFAULT_TTL = 6 * 3600                 # 6 ساعات: التحليلات تتغير مع البيانات
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024   # الحد الأقصى لحجم الردود المحفوظة
+
+_SPACES_RE = re.compile(r"\s+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_prompt_cache (
+    prompt_key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ai_prompt_cache_last_used ON ai_prompt_cache (last_used);
+"""
+
+
+def prompt_key(model, prompt):
+    """sha256 للنموذج + الطلب بعد توحيد المسافات (الفروق في التنسيق لا تغيّر المفتاح)"""
+    normalized = _SPACES_RE.sub(" ", str(prompt)).strip()
+    return hashlib.sha256(f"{model}\x1f{normalized}".encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """ذاكرة SQLite مع مدة صلاحية (TTL) وحد للحجم يحذف الأقل استخداماً أولاً"""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.conn = local_store.connect(path)
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()
+
+    def get(self, model, prompt):
+        """نص الرد المحفوظ أو None"""
+        key = prompt_key(model, prompt)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created_at FROM ai_prompt_cache WHERE prompt_key = ?",
+                                    (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE ai_prompt_cache SET last_used = ? WHERE prompt_key = ?", (now, key))
+            return row[0]
+
+    def put(self, model, prompt, response):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ai_prompt_cache (prompt_key, model, response, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (prompt_key(model, prompt), model, response, size, now, now))
+        self.evict()
+
+    def evict(self):
+        """حذف المنتهية صلاحيتها ثم الأقل استخداماً حتى يعود الحجم تحت الحد"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM ai_prompt_cache WHERE created_at < ?", (time.time() - self.ttl,))
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM ai_prompt_cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            removed, to_delete = 0, []
+            for key, size in self.conn.execute("SELECT prompt_key, size FROM ai_prompt_cache ORDER BY last_used"):
+                if total - removed <= self.max_bytes:
+                    break
+                to_delete.append((key,))
+                removed += size
+            self.conn.executemany("DELETE FROM ai_prompt_cache WHERE prompt_key = ?", to_delete)
+
+
+_prompt_cache = None
+_prompt_cache_lock = threading.Lock()
+
+
+def get_prompt_cache():
+    """نسخة واحدة مشتركة لكل عملية"""
+    global _prompt_cache
+    with _prompt_cache_lock:
+        if _prompt_cache is None:
+            _prompt_cache = PromptCache()
+        return _prompt_cache
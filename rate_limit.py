@@ -0,0 +1,145 @@
+"""
+rate_limit.py
+حد طلبات تكيّفي مشترك لكل العملية (Gemini / OpenRouter)
+عند 429 يحترم Retry-After أو ينتظر بتراجع أُسّي عشوائي، والانتظار يتم في خيوط خلفية لا في خيط الواجهة
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from email.utils import parsedate_to_datetime
+
+import requests
+
+BASE_BACKOFF = 2.0      # ثوانٍ
+MAX_BACKOFF = 120.0
+POLL_INTERVAL = 0.5     # كل كم ثانية تُحدَّث رسالة الانتظار في الواجهة
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Retry-After بالثواني أو كتاريخ HTTP؛ None إذا لم يوجد أو تعذر فهمه"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def retry_delay(attempt, base=BASE_BACKOFF, cap=MAX_BACKOFF):
+    """انتظار قبل إعادة محاولة طلب واحد (مهلة/انقطاع/5xx) في خيطه فقط، دون إيقاف بقية الطلبات"""
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+class AdaptiveLimiter:
+    """حالة مزود واحد مشتركة بين كل الجلسات: موعد السماح التالي + عدد مرات الرفض المتتالية"""
+
+    def __init__(self, name, base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF):
+        self.name = name
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.blocked_until = 0.0
+        self.strikes = 0
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        """الثواني المتبقية قبل السماح بطلب جديد"""
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def wait_ready(self):
+        """انتظار (في الخيط الحالي) حتى يسمح المزود بطلب جديد"""
+        while True:
+            wait = self.wait_time()
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 1.0))
+
+    def backoff(self, retry_after=None):
+        """تسجيل رفض؛ Retry-After له الأولوية وإلا تراجع أُسّي مع عشوائية"""
+        with self.lock:
+            self.strikes += 1
+            if retry_after is None:
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (self.strikes - 1))
+                retry_after = delay * random.uniform(0.5, 1.5)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            return retry_after
+
+    def success(self):
+        with self.lock:
+            self.strikes = max(0, self.strikes - 1)
+
+    def observe(self, response):
+        """تحديث الحالة من رد HTTP؛ تعيد True إذا كان الرد قابلاً لإعادة المحاولة
+
+        التراجع المشترك (لكل الجلسات) فقط عند 429 أو Retry-After صريح؛ 5xx بدونه فشل لهذا الطلب وحده
+        """
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if response.status_code == 429:
+            self.backoff(retry_after)
+            return True
+        if response.status_code in RETRY_STATUSES:
+            if retry_after is not None:
+                self.backoff(retry_after)
+            return True
+        self.success()
+        return False
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ai-http")
+
+
+def get_limiter(name):
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = AdaptiveLimiter(name)
+        return _limiters[name]
+
+
+def request(provider, send, max_retries=3):
+    """تنفيذ send() مع احترام حد المزود وإعادة المحاولة؛ تعيد آخر رد أو ترفع آخر استثناء
+
+    المهلة والانقطاع و5xx بدون Retry-After تُعاد بانتظار في هذا الخيط فقط (retry_delay)
+    """
+    limiter = get_limiter(provider)
+    for attempt in range(max_retries):
+        limiter.wait_ready()
+        try:
+            response = send()
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            if attempt == max_retries - 1:
+                raise
+            time.sleep(retry_delay(attempt))
+            continue
+        if not limiter.observe(response) or attempt == max_retries - 1:
+            return response
+        if response.status_code != 429 and parse_retry_after(response.headers.get("Retry-After")) is None:
+            time.sleep(retry_delay(attempt))
+
+
+def submit(provider, send, max_retries=3):
+    """إرسال الطلب إلى الخيوط المشتركة؛ تعيد Future"""
+    return _executor.submit(request, provider, send, max_retries)
+
+
+def wait_for(future, provider, on_wait=None):
+    """انتظار نتيجة Future مع إبلاغ on_wait(ثوانٍ) بالانتظار المتوقع عند تجاوز الحد"""
+    limiter = get_limiter(provider)
+    while True:
+        try:
+            return future.result(timeout=POLL_INTERVAL)
+        except FutureTimeout:
+            if on_wait:
+                on_wait(limiter.wait_time())
+
+
+def run(fn, *args, **kwargs):
+    """تشغيل دالة كاملة (طلب + معالجة الرد) في الخيوط المشتركة؛ تعيد Future"""
+    return _executor.submit(fn, *args, **kwargs)
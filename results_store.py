@@ -0,0 +1,149 @@
+"""
+results_store.py
+نتائج التحليل كصفوف مستقلة في Supabase (جدول analysis_result_rows) بدل نص results_json واحد ضخم
+كل صف = (رقم التشغيل، القسم، ترتيب الصف، بيانات الصف) فيُقرأ كل قسم وحده صفحةً صفحة
+"""
+
+import json
+
+import pandas as pd
+
+TABLE = "analysis_result_rows"
+SECTIONS = ["raise", "lower", "approved", "missing", "review"]
+SECTION_LABELS = {"raise": "رفع سعر", "lower": "خفض سعر", "approved": "موافق"}
+WRITE_BATCH = 500
+PAGE_SIZE = 50
+
+# يُنفَّذ مرة واحدة في محرر SQL الخاص بـ Supabase
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_result_rows (
+    id      BIGSERIAL PRIMARY KEY,
+    run_id  BIGINT NOT NULL REFERENCES analysis_results(id) ON DELETE CASCADE,
+    section TEXT   NOT NULL,
+    row_no  INTEGER NOT NULL,
+    data    JSONB  NOT NULL,
+    UNIQUE (run_id, section, row_no)
+);
+"""
+# الفهرس الفريد (run_id, section, row_no) يخدم قراءة الصفحات بالترتيب دون فهرس إضافي
+
+
+def _records(df):
+    """صفوف DataFrame كقواميس قابلة لـ JSON (NaN -> null، التواريخ ISO، أنواع numpy -> Python)"""
+    return json.loads(df.to_json(orient="records", force_ascii=False, date_format="iso"))
+
+
+def save_run_rows(client, run_id, results, batch_size=WRITE_BATCH):
+    """حفظ أقسام التشغيل على دفعات upsert (إعادة الحفظ لا تكرر الصفوف)؛ يعيد عدد الصفوف المحفوظة"""
+    saved = 0
+    for section in SECTIONS:
+        df = results.get(section)
+        if df is None or df.empty:
+            continue
+        records = _records(df)
+        for start in range(0, len(records), batch_size):
+            rows = [{"run_id": run_id, "section": section, "row_no": start + i, "data": rec}
+                    for i, rec in enumerate(records[start:start + batch_size])]
+            # return=minimal: الرد لا يُقرأ، فلا داعي لإعادة jsonb كل الصفوف
+            r = client.upsert(TABLE, rows, on_conflict="run_id,section,row_no", returning="minimal")
+            r.raise_for_status()
+            saved += len(rows)
+    return saved
+
+
+def has_rows(client, run_id):
+    """هل حُفظ هذا التشغيل بالصيغة الجديدة؟ (التشغيلات القديمة في results_json فقط)"""
+    r = client.select(TABLE, params={"select": "id", "run_id": f"eq.{run_id}", "limit": "1"})
+    r.raise_for_status()
+    return bool(r.json())
+
+
+def load_section_rows(client, run_id, section, offset=0, limit=PAGE_SIZE):
+    """صفوف row_no في [offset, offset+limit) من قسم واحد (عبر الفهرس، دون مسح الجدول)؛ الفهرس = row_no"""
+    r = client.select(TABLE, params={
+        "select": "row_no,data",
+        "run_id": f"eq.{run_id}",
+        "section": f"eq.{section}",
+        "row_no": f"gte.{offset}",
+        "order": "row_no.asc",
+        "limit": str(limit),
+    })
+    r.raise_for_status()
+    return _frame(r.json())
+
+
+def _frame(rows):
+    """DataFrame من صفوف (row_no, data) بفهرس row_no: رقم ثابت للصف في قسمه مهما كانت الصفحة"""
+    return pd.DataFrame([row["data"] for row in rows], index=[row["row_no"] for row in rows])
+
+
+def load_section_page(client, run_id, section, page=0, page_size=PAGE_SIZE):
+    """صفحة واحدة من قسم (page تبدأ من 0)"""
+    return load_section_rows(client, run_id, section, page * page_size, page_size)
+
+
+def load_all_page(client, run_id, counts, page=0, page_size=PAGE_SIZE):
+    """صفحة من جدول all (رفع ثم خفض ثم موافق) بأعداد الأقسام counts دون تحميل الأقسام كاملة"""
+    offset, remaining = page * page_size, page_size
+    parts = {}
+    for section in SECTION_LABELS:
+        count = counts.get(section, 0)
+        if offset >= count:
+            offset -= count
+            continue
+        parts[section] = load_section_rows(client, run_id, section, offset, min(remaining, count - offset))
+        remaining -= len(parts[section])
+        offset = 0
+        if remaining <= 0:
+            break
+    return combine_all(parts)
+
+
+def iter_section(client, run_id, section, page_size=1000):
+    """كل صفوف القسم على صفحات (keyset على row_no)؛ كل صف = {"row_no", "data"}"""
+    yield from client.iter_pages(TABLE, select="row_no,data", page_size=page_size, key="row_no",
+                                 filters={"run_id": f"eq.{run_id}", "section": f"eq.{section}"})
+
+
+def load_section(client, run_id, section):
+    """القسم كاملاً كـ DataFrame (الفهرس = row_no كما في الصفحات)"""
+    rows = []
+    for page in iter_section(client, run_id, section):
+        rows.extend(page)
+    return _frame(rows)
+
+
+def load_runs(client, run_ids, page_size=1000):
+    """أقسام عدة تشغيلات باستعلام واحد (run_id=in.(...)، keyset على id) بدل has_rows + load_section لكل تشغيل.
+
+    يعيد {run_id: {القسم: DataFrame}} للتشغيلات المحفوظة بالصيغة الجديدة فقط؛ الغائبة قديمة (results_json).
+    """
+    runs = {}
+    if not run_ids:
+        return runs
+    ids = ",".join(str(run_id) for run_id in run_ids)
+    for rows in client.iter_pages(TABLE, select="id,run_id,section,row_no,data", page_size=page_size,
+                                  filters={"run_id": f"in.({ids})"}):
+        for row in rows:
+            runs.setdefault(row["run_id"], {}).setdefault(row["section"], []).append(row)
+    return {run_id: {section: _frame(sorted(sections.get(section, []), key=lambda row: row["row_no"]))
+                     for section in SECTIONS}
+            for run_id, sections in runs.items()}
+
+
+def delete_run_rows(client, run_id):
+    """حذف صفوف تشغيل (مثلاً بعد حفظ جزئي فاشل) حتى لا يُقرأ نصف تشغيل"""
+    r = client.request("DELETE", TABLE, params={"run_id": f"eq.{run_id}"})
+    r.raise_for_status()
+
+
+def combine_all(sections):
+    """جدول all: رفع + خفض + موافق مع عمود التوصية (نفس هيكل النتائج القديمة)"""
+    frames = []
+    for key, label in SECTION_LABELS.items():
+        df = sections.get(key)
+        if df is not None and not df.empty:
+            df = df.copy()
+            df["التوصية"] = label
+            frames.append(df)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
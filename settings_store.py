@@ -0,0 +1,158 @@
+"""
+settings_store.py
+إعدادات التطبيق (جدول app_settings) بذاكرة مؤقتة داخل العملية:
+قراءة كل الإعدادات بطلب واحد، صلاحية TTL، كتابة بـ upsert واحد تُحدّث الذاكرة فوراً (write-through)
+
+متطلب: تنفيذ SCHEMA مرة واحدة (قيد فريد على key). قبل ذلك يُكتشف غياب القيد من رد upsert
+ويُكتب الإعداد بـ PATCH ثم POST إن لم يوجد (دون تكرار المفتاح).
+"""
+
+import json
+import threading
+import time
+
+TABLE = "app_settings"
+DEFAULT_TTL = 300  # ثوانٍ
+
+# upsert على key يحتاج قيداً فريداً (يُنفَّذ مرة واحدة في محرر SQL الخاص بـ Supabase قبل النشر)
+SCHEMA = """
+DELETE FROM app_settings a USING app_settings b WHERE a.key = b.key AND a.ctid < b.ctid;
+ALTER TABLE app_settings ADD CONSTRAINT app_settings_key_unique UNIQUE (key);
+"""
+
+
+_OK = (200, 201, 204)
+
+
+def _missing_constraint(response):
+    """رد PostgREST عند on_conflict بلا قيد فريد مطابق (42P10)"""
+    return response.status_code == 400 and "42P10" in (response.text or "")
+
+
+def _decode(raw):
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return raw
+
+
+class SettingsStore:
+    """نسخة محلية من app_settings مشتركة بين الجلسات والخيوط"""
+
+    def __init__(self, client, ttl=DEFAULT_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.values = {}
+        self.loaded_at = None
+        self.unique_key = None   # None = غير معروف، False = القيد غير موجود (SCHEMA لم يُنفَّذ)
+        self.generation = 0      # يزيد مع كل set/invalidate
+        self.written = {}        # مفتاح -> generation آخر كتابة له
+        self.invalidated = 0     # generation آخر invalidate
+        self.loading = None      # Event لإعادة التحميل الجارية (single-flight)
+        self.lock = threading.Lock()
+
+    def _expired(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at >= self.ttl
+
+    def load_all(self):
+        """كل الإعدادات بطلب واحد (عند بدء التشغيل أو انتهاء الصلاحية)
+
+        قيم مفاتيح كُتبت أثناء الجلب (generation أحدث) لا تُستبدل بالمقروءة قبلها،
+        وجلب بدأ قبل invalidate لا يجعل النسخة صالحة
+        """
+        with self.lock:
+            start = self.generation
+        r = self.client.select(TABLE, params={"select": "key,value"})
+        r.raise_for_status()
+        rows = r.json()
+        values = {row["key"]: _decode(row.get("value")) for row in rows}
+        if len(values) < len(rows):
+            self.unique_key = False  # مفاتيح مكررة: القيد غير موجود
+        with self.lock:
+            newer = {k: self.values[k] for k, g in self.written.items() if g > start and k in self.values}
+            self.values = {**values, **newer}
+            self.written = {k: g for k, g in self.written.items() if g > start}
+            if self.invalidated <= start:
+                self.loaded_at = time.monotonic()
+            return dict(self.values)
+
+    def _refresh(self):
+        """إعادة التحميل عند انتهاء الصلاحية بطلب واحد مهما تعدد المستدعون (مثل db_stats)"""
+        while True:
+            with self.lock:
+                if not self._expired():
+                    return
+                event = self.loading
+                leader = event is None
+                if leader:
+                    event = self.loading = threading.Event()
+            if not leader:
+                event.wait()
+                continue  # نتيجة التحميل الجاري (أو محاولة جديدة إن فشل)
+            try:
+                self.load_all()
+                return
+            finally:
+                with self.lock:
+                    self.loading = None
+                event.set()
+
+    def preload(self):
+        """تحميل الكل عند بدء الجلسة إن لم تكن النسخة المحلية صالحة"""
+        self._refresh()
+
+    def get(self, key, default=None):
+        """من الذاكرة؛ طلب شبكة فقط إذا انتهت الصلاحية (ويجلب كل الإعدادات معاً)"""
+        self._refresh()
+        with self.lock:
+            return self.values.get(key, default)
+
+    def set(self, key, value):
+        """upsert واحد (لا توجد لحظة يختفي فيها المفتاح) ثم تحديث الذاكرة؛ يعيد True عند النجاح"""
+        raw = json.dumps(value, ensure_ascii=False, default=str)
+        ok = False
+        if self.unique_key is not False:
+            r = self.client.upsert(TABLE, {"key": key, "value": raw}, on_conflict="key")
+            ok = r.status_code in _OK
+            if _missing_constraint(r):
+                self.unique_key = False
+        if self.unique_key is False:
+            ok = self._update_or_insert(key, raw)
+        if not ok:
+            self.invalidate()
+            return False
+        with self.lock:
+            self.generation += 1
+            self.written[key] = self.generation
+            self.values[key] = _decode(raw)
+        return True
+
+    def _update_or_insert(self, key, raw):
+        """بدون القيد الفريد: تحديث الصفوف الموجودة، وإدخال صف فقط إذا لم يوجد المفتاح"""
+        r = self.client.request("PATCH", TABLE, data={"value": raw}, params={"key": f"eq.{key}"},
+                                prefer="return=representation")
+        if r.status_code not in _OK:
+            return False
+        if r.json():
+            return True
+        r = self.client.request("POST", TABLE, data={"key": key, "value": raw})
+        return r.status_code in _OK
+
+    def invalidate(self):
+        """إجبار القراءة التالية على إعادة التحميل"""
+        with self.lock:
+            self.generation += 1
+            self.invalidated = self.generation
+            self.loaded_at = None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_settings_store(client, ttl=DEFAULT_TTL):
+    """مخزن واحد لكل عميل Supabase في العملية"""
+    with _stores_lock:
+        if id(client) not in _stores:
+            _stores[id(client)] = SettingsStore(client, ttl)
+        return _stores[id(client)]
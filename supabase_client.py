@@ -0,0 +1,115 @@
+"""
+supabase_client.py
+عميل Supabase REST مشترك: جلسة HTTP واحدة (keep-alive + مجمع اتصالات)، ترميز صحيح للمعاملات،
+إعادة محاولة مع تراجع للطلبات الآمنة للتكرار، ودعم PATCH و upsert
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 15
+POOL_SIZE = 10
+MAX_RETRIES = 3
+BACKOFF = 0.5                  # ثوانٍ: 0.5، 1، 2 ...
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+
+class SupabaseClient:
+    """طلبات PostgREST عبر جلسة واحدة مشتركة بين كل الجلسات والخيوط"""
+
+    def __init__(self, url, key, timeout=DEFAULT_TIMEOUT, pool_size=POOL_SIZE, max_retries=MAX_RETRIES):
+        self.base_url = f"{url.rstrip('/')}/rest/v1"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "Prefer": "return=representation",
+        })
+
+    def request(self, method, table, data=None, params=None, prefer=None, idempotent=None):
+        """طلب واحد؛ يعيد كائن الرد أو يرفع آخر استثناء اتصال
+
+        idempotent: إعادة المحاولة عند الأخطاء المؤقتة (افتراضياً لـ GET/PUT/DELETE فقط)
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        headers = {"Prefer": prefer} if prefer else None
+        attempts = self.max_retries if idempotent else 1
+        for attempt in range(attempts):
+            try:
+                r = self.session.request(method, f"{self.base_url}/{table}", params=params, json=data,
+                                         headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == attempts - 1:
+                    raise
+            else:
+                if r.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                    return r
+            time.sleep(BACKOFF * 2 ** attempt)
+
+    def select(self, table, params=None):
+        return self.request("GET", table, params=params)
+
+    def insert(self, table, rows):
+        return self.request("POST", table, data=rows)
+
+    def upsert(self, table, rows, on_conflict=None, returning="representation"):
+        """إدخال أو تحديث حسب المفتاح الفريد (آمن للتكرار فيُعاد عند الفشل)
+
+        returning="minimal": بدون إعادة الصفوف في الرد (للكتابة الجماعية التي لا تقرأ الرد)
+        """
+        params = {"on_conflict": on_conflict} if on_conflict else None
+        return self.request("POST", table, data=rows, params=params,
+                            prefer=f"resolution=merge-duplicates,return={returning}", idempotent=True)
+
+    def update(self, table, values, filters):
+        """PATCH للصفوف المطابقة لـ filters مثل {"key": "eq.x"}"""
+        return self.request("PATCH", table, data=values, params=filters)
+
+    def delete(self, table, filters):
+        return self.request("DELETE", table, params=filters)
+
+    def iter_pages(self, table, select="*", page_size=1000, filters=None, key="id"):
+        """قراءة جدول كامل على صفحات بمفتاح متزايد (keyset) بدل offset أو طلب واحد ضخم
+
+        كل صفحة: key > آخر قيمة مقروءة مرتبة تصاعدياً؛ الذاكرة = صفحة واحدة فقط.
+        select يجب أن يتضمن key.
+        """
+        last = None
+        while True:
+            params = {"select": select, "order": f"{key}.asc", "limit": str(page_size), **(filters or {})}
+            if last is not None:
+                params[key] = f"gt.{last}"
+            r = self.select(table, params=params)
+            r.raise_for_status()
+            rows = r.json()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < page_size:
+                return
+            last = rows[-1][key]
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url, key):
+    """عميل واحد لكل (url, key) في العملية"""
+    with _clients_lock:
+        if (url, key) not in _clients:
+            _clients[(url, key)] = SupabaseClient(url, key)
+        return _clients[(url, key)]
@@ -0,0 +1,138 @@
+"""
+test_ai_pipeline.py
+VerificationPipeline و TokenBucket مقابل خادم HTTP محلي بديل لمزود الذكاء الاصطناعي
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_pipeline import TokenBucket, VerificationPipeline, configure_provider, provider_slot  # noqa: E402
+from profiling import StageProfiler  # noqa: E402
+
+
+class StubProvider:
+    """يرد بحكم لكل زوج بعد latency ثانية، ويسجل أقصى عدد طلبات متزامنة"""
+
+    def __init__(self, latency=0.05, status=200):
+        self.latency = latency
+        self.status = status
+        self.requests = 0
+        self.inflight = 0
+        self.max_inflight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                pairs = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.lock:
+                    stub.requests += 1
+                    stub.inflight += 1
+                    stub.max_inflight = max(stub.max_inflight, stub.inflight)
+                try:
+                    time.sleep(stub.latency)
+                    body = json.dumps({"verdicts": [{"id": p["id"], "is_match": True} for p in pairs]}).encode()
+                    self.send_response(stub.status)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with stub.lock:
+                        stub.inflight -= 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def verify_batch(self, provider):
+        def verify(pairs):
+            with provider_slot(provider):
+                req = urllib.request.Request(self.url, data=json.dumps(pairs).encode(), method="POST")
+                with urllib.request.urlopen(req, timeout=5) as r:
+                    return {v["id"]: v for v in json.loads(r.read())["verdicts"]}
+        return verify
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubProvider()
+    yield server
+    server.close()
+
+
+def _pairs(n):
+    return [{"id": i, "my_name": f"عطر {i}", "comp_name": f"عطر {i}"} for i in range(n)]
+
+
+def test_every_pair_verified_in_batches(stub):
+    configure_provider("stub_batches", rpm=6000, max_concurrency=4)
+    with VerificationPipeline(stub.verify_batch("stub_batches"), batch_size=20) as pipeline:
+        for pair in _pairs(45):
+            pipeline.submit(pair)
+    assert sorted(pipeline.verdicts) == list(range(45))
+    assert stub.requests == 3
+    assert pipeline.errors == 0
+
+
+def test_provider_concurrency_limit(stub):
+    configure_provider("stub_concurrency", rpm=6000, max_concurrency=2)
+    with VerificationPipeline(stub.verify_batch("stub_concurrency"), batch_size=1, workers=6) as pipeline:
+        for pair in _pairs(12):
+            pipeline.submit(pair)
+    assert len(pipeline.verdicts) == 12
+    assert stub.max_inflight <= 2
+
+
+def test_full_queue_blocks_submit_and_is_profiled():
+    server = StubProvider(latency=0.2)
+    try:
+        configure_provider("stub_backpressure", rpm=6000, max_concurrency=1)
+        profiler = StageProfiler()
+        pipeline = VerificationPipeline(server.verify_batch("stub_backpressure"), batch_size=1, workers=1,
+                                        max_queue=1, profiler=profiler)
+        for pair in _pairs(4):
+            pipeline.submit(pair)
+        pipeline.close()
+    finally:
+        server.close()
+    assert len(pipeline.verdicts) == 4
+    assert pipeline.submit_wait > 0.2
+    assert profiler.stages["ai_backpressure"]["seconds"] == pytest.approx(pipeline.submit_wait)
+
+
+def test_failed_batches_counted_without_stopping_workers():
+    server = StubProvider(status=500)
+    try:
+        configure_provider("stub_errors", rpm=6000, max_concurrency=2)
+        with VerificationPipeline(server.verify_batch("stub_errors"), batch_size=5, workers=2) as pipeline:
+            for pair in _pairs(20):
+                pipeline.submit(pair)
+    finally:
+        server.close()
+    assert pipeline.verdicts == {}
+    assert pipeline.errors == 4
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(600, capacity=1)  # 10 طلبات/ثانية بلا دفقة
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+    assert 0.4 <= elapsed < 1.5
@@ -0,0 +1,136 @@
+"""
+test_buffered_writer.py
+BufferedWriter مع جدول بديل بنفس واجهة supabase (بدون شبكة)، وتسليم الدفعة لنقطة الاستئناف
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("streamlit")
+pytest.importorskip("supabase")
+
+from db_manager import BufferedWriter  # noqa: E402
+
+
+class StubTable:
+    """insert يتوقف حتى release (إن وُجد) ويفشل أول fail_times مرة"""
+
+    def __init__(self, release=None, fail_times=0):
+        self.release = release
+        self.fail_times = fail_times
+        self.started = threading.Event()
+        self.inserted = []
+        self.batch = None
+
+    def table(self, name):
+        return self
+
+    def insert(self, batch):
+        self.batch = batch
+        return self
+
+    def execute(self):
+        self.started.set()
+        if self.release is not None:
+            self.release.wait(5)
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("503")
+        self.inserted.extend(self.batch)
+
+
+def test_flush_waits_for_background_batch():
+    release = threading.Event()
+    table = StubTable(release=release)
+    writer = BufferedWriter(table, "analysis_results", batch_size=2, flush_interval=60)
+    writer.add({"id": 1})
+    writer.add({"id": 2})  # دفعة كاملة: يأخذها الخيط الخلفي
+    assert table.started.wait(5)
+
+    done = []
+    flusher = threading.Thread(target=lambda: done.append(writer.flush()))
+    flusher.start()
+    flusher.join(0.3)
+    # المخزن فارغ لكن الإرسال لم ينته: flush لا يعود قبله
+    assert not done
+
+    release.set()
+    flusher.join(5)
+    assert done == [0]
+    assert len(table.inserted) == 2
+    assert writer.stats["written"] == 2 and writer.stats["batches"] == 1
+    writer.close()
+
+
+def test_flush_retries_then_reports_failures_once():
+    table = StubTable(fail_times=1)
+    writer = BufferedWriter(table, "analysis_results", batch_size=10, flush_interval=60, max_retries=1)
+    writer.add({"id": 1})
+    assert writer.flush() == 0
+    assert table.inserted == [{"id": 1}]
+    assert writer.stats["retries"] == 1
+
+    table.fail_times = 2
+    writer.add({"id": 2})
+    writer.add({"id": 3})
+    assert writer.flush() == 2
+    # الفشل يُبلَّغ مرة واحدة فقط: الدفعة التالية نظيفة
+    writer.add({"id": 4})
+    assert writer.flush() == 0
+    assert writer.stats["failed"] == 2
+    writer.close()
+
+
+def test_failed_chunk_is_not_checkpointed(tmp_path, monkeypatch):
+    pytest.importorskip("pandas")
+    pytest.importorskip("rapidfuzz")
+    import pandas as pd
+
+    import functools
+
+    import final_engine
+    import local_store
+    from checkpoint import CheckpointStore
+
+    monkeypatch.setattr(local_store, "DB_PATH", str(tmp_path / "local.db"))
+    monkeypatch.setattr(final_engine, "get_or_build_index",
+                        functools.partial(final_engine.get_or_build_index, cache_dir=str(tmp_path / "token_index")))
+
+    saved = []
+
+    class FailingFirstChunk:
+        """الدفعة الأولى تفشل كتابتها، الثانية تنجح"""
+
+        def __init__(self):
+            self.flushes = 0
+
+        def save_match(self, my_prod, comp_prod, res):
+            return None
+
+        def flush(self):
+            self.flushes += 1
+            return 1 if self.flushes == 1 else 0
+
+        def close(self):
+            return None
+
+    original_save = CheckpointStore.save_chunk
+
+    def record_save(self, chunk_no, results):
+        saved.append(chunk_no)
+        return original_save(self, chunk_no, results)
+
+    monkeypatch.setattr(final_engine, "DatabaseManager", FailingFirstChunk)
+    monkeypatch.setattr(CheckpointStore, "save_chunk", record_save)
+
+    my_df = pd.DataFrame({"name": ["Dior Sauvage 100ml", "Chanel Bleu 100ml"], "price": [400, 500]})
+    comp_df = pd.DataFrame({"name": ["Dior Sauvage EDP 100ml", "Chanel Bleu EDT 100ml"], "price": [390, 520]})
+    df = final_engine.run_super_analysis(my_df, comp_df, chunk_size=1)
+
+    assert len(df) == 2
+    assert saved == [1]
@@ -0,0 +1,47 @@
+"""
+test_checkpoint.py
+حذف نقاط الاستئناف لتشغيلات متروكة (قديمة أو زائدة عن العدد) دون المساس بالتشغيل الحالي
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pandas")
+
+import local_store  # noqa: E402
+from checkpoint import _SCHEMA, MAX_AGE, CheckpointStore  # noqa: E402
+
+
+def _seed(path, runs):
+    """runs: {run_key: عمر آخر دفعة بالثواني}"""
+    conn = local_store.connect(path)
+    conn.executescript(_SCHEMA)
+    with conn:
+        conn.executemany("INSERT INTO checkpoint_chunks (run_key, chunk_no, results_json, created_at) "
+                         "VALUES (?, 0, '[]', ?)", [(key, time.time() - age) for key, age in runs.items()])
+    return conn
+
+
+def _runs(conn):
+    return {key for key, in conn.execute("SELECT DISTINCT run_key FROM checkpoint_chunks")}
+
+
+def test_stale_and_extra_runs_are_evicted(tmp_path):
+    path = str(tmp_path / "local.db")
+    conn = _seed(path, {"old": MAX_AGE + 60, "r1": 600, "r2": 500, "r3": 400, "r4": 300, "r5": 200})
+
+    # التشغيل الحالي يبقى ولو كان الأقدم؛ مع أحدث 4 غيره (MAX_RUNS = 5)، والمتروك منذ أكثر من MAX_AGE يُحذف
+    current = CheckpointStore("r1", path=path)
+    assert current.completed_chunks() == {0: []}
+    current.close()
+    assert _runs(conn) == {"r1", "r2", "r3", "r4", "r5"}
+
+    # تشغيل جديد: يبقى أحدث 4 تشغيلات سابقة فقط
+    CheckpointStore("new", path=path).close()
+    assert _runs(conn) == {"r2", "r3", "r4", "r5"}
+    conn.close()
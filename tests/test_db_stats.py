@@ -0,0 +1,180 @@
+"""
+test_db_stats.py
+ذاكرة db_stats المؤقتة على عميل بديل بنفس واجهة supabase_client (بدون شبكة)
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_stats  # noqa: E402
+
+ROW = {"total_records": 3, "raise_count": 1, "lower_count": 2, "approved_count": 0,
+       "total_sends": 4, "successful_sends": 4}
+
+
+class StubResponse:
+    def __init__(self, rows, status_code=200):
+        self.rows = rows
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self):
+        return self.rows
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+class StubClient:
+    """عرض db_stats بزمن استجابة delay؛ release يوقف الرد حتى يُسمح له"""
+
+    def __init__(self, delay=0.0, release=None):
+        self.delay = delay
+        self.release = release
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def select(self, table, params=None):
+        with self.lock:
+            self.calls += 1
+        if self.release:
+            self.release.wait(5)
+        time.sleep(self.delay)
+        return StubResponse([ROW])
+
+
+def setup_function():
+    db_stats.invalidate()
+
+
+def test_concurrent_callers_share_one_fetch():
+    client = StubClient(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(db_stats.get_db_stats(client)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert client.calls == 1
+    assert results == [ROW] * 8
+
+
+def test_slow_fetch_does_not_block_other_clients():
+    release = threading.Event()
+    slow, fast = StubClient(release=release), StubClient()
+    worker = threading.Thread(target=db_stats.get_db_stats, args=(slow,))
+    worker.start()
+    try:
+        start = time.monotonic()
+        assert db_stats.get_db_stats(fast) == ROW
+        assert time.monotonic() - start < 1.0
+    finally:
+        release.set()
+        worker.join()
+
+
+def test_ttl_and_invalidate():
+    client = StubClient()
+    db_stats.get_db_stats(client, ttl=60)
+    db_stats.get_db_stats(client, ttl=60)
+    assert client.calls == 1
+    db_stats.invalidate()
+    db_stats.get_db_stats(client, ttl=60)
+    assert client.calls == 2
+    db_stats.get_db_stats(client, ttl=0)
+    assert client.calls == 3
+
+
+def test_fetch_started_before_invalidate_is_not_cached():
+    release = threading.Event()
+    client = StubClient(release=release)
+    worker = threading.Thread(target=db_stats.get_db_stats, args=(client,))
+    worker.start()
+    while client.calls == 0:
+        time.sleep(0.01)
+    db_stats.invalidate()
+    release.set()
+    worker.join()
+    db_stats.get_db_stats(client)
+    assert client.calls == 2
+
+
+class TableClient:
+    """PostgREST بديل بدون عرض db_stats (404): صفوف حقيقية تُقرأ على صفحات keyset وأعداد عبر Content-Range"""
+
+    def __init__(self, tables, delay=0.0):
+        self.tables = tables
+        self.delay = delay
+        self.view_calls = 0
+        self.pages = 0
+        self.lock = threading.Lock()
+
+    def _rows(self, table, params):
+        rows = self.tables[table]
+        for column, cond in params.items():
+            if column in ("select", "order", "limit"):
+                continue
+            op, _, value = cond.partition(".")
+            if op == "gt":
+                rows = [r for r in rows if r[column] > int(value)]
+            elif op == "eq":
+                rows = [r for r in rows if str(r[column]) == value]
+        return sorted(rows, key=lambda r: r["id"])
+
+    def select(self, table, params=None):
+        params = params or {}
+        if table == db_stats.VIEW:
+            with self.lock:
+                self.view_calls += 1
+            time.sleep(self.delay)
+            return StubResponse({"message": "relation does not exist"}, status_code=404)
+        with self.lock:
+            self.pages += 1
+        return StubResponse(self._rows(table, params)[:int(params.get("limit", 10 ** 9))])
+
+    def iter_pages(self, *args, **kwargs):
+        # نفس ترقيم الصفحات الحقيقي فوق select البديل
+        from supabase_client import SupabaseClient
+        return SupabaseClient.iter_pages(self, *args, **kwargs)
+
+    def request(self, method, table, data=None, params=None, prefer=None, idempotent=False):
+        assert method == "GET" and prefer == "count=exact"
+        rows = self._rows(table, params or {})
+        r = StubResponse(rows[:1])
+        r.headers["Content-Range"] = f"0-0/{len(rows)}"
+        return r
+
+
+def _analysis_rows(n):
+    # 1 رفع، 2 خفض، 3 موافق بالتناوب
+    return [{"id": i, "price_increase": int(i % 3 == 0), "price_decrease": int(i % 3 == 1),
+             "approved": int(i % 3 == 2)} for i in range(1, n + 1)]
+
+
+def test_fallback_without_view_pages_and_counts():
+    pytest.importorskip("requests")
+    client = TableClient({
+        "analysis_results": _analysis_rows(2500),
+        "send_log": [{"id": i, "status": "نجح" if i % 4 else "فشل"} for i in range(1, 41)],
+    }, delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(db_stats.get_db_stats(client)))
+               for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    expected = {"total_records": 2500, "raise_count": 833, "lower_count": 834, "approved_count": 833,
+                "total_sends": 40, "successful_sends": 30}
+    assert results == [expected] * 6
+    assert client.view_calls == 1          # جلب واحد لكل المتزامنين
+    assert client.pages == 3               # 1000 + 1000 + 500 بمفتاح id
@@ -0,0 +1,102 @@
+"""
+test_settings_store.py
+SettingsStore على عميل بديل بنفس واجهة supabase_client: تحميل واحد للمتزامنين،
+وقيمة set لا تُستبدل بقراءة بدأت قبلها
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settings_store import SettingsStore  # noqa: E402
+
+
+class StubResponse:
+    def __init__(self, rows, status_code=200):
+        self.rows = rows
+        self.status_code = status_code
+        self.text = ""
+
+    def json(self):
+        return self.rows
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+class StubClient:
+    """app_settings في الذاكرة؛ select يقرأ الصفوف ثم ينتظر release (إن وُجد) قبل الرد"""
+
+    def __init__(self, rows, delay=0.0, release=None):
+        self.rows = dict(rows)
+        self.delay = delay
+        self.release = release
+        self.selects = 0
+        self.lock = threading.Lock()
+
+    def select(self, table, params=None):
+        with self.lock:
+            self.selects += 1
+            snapshot = [{"key": k, "value": json.dumps(v)} for k, v in self.rows.items()]
+        if self.release:
+            self.release.wait(5)
+        time.sleep(self.delay)
+        return StubResponse(snapshot)
+
+    def upsert(self, table, data, on_conflict=None):
+        with self.lock:
+            self.rows[data["key"]] = json.loads(data["value"])
+        return StubResponse([], 201)
+
+
+def test_concurrent_expired_reads_share_one_load():
+    client = StubClient({"threshold": 60}, delay=0.2)
+    store = SettingsStore(client)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get("threshold"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [60] * 8
+    assert client.selects == 1
+
+
+def test_set_during_load_is_not_overwritten():
+    release = threading.Event()
+    client = StubClient({"threshold": 60, "theme": "dark"}, release=release)
+    store = SettingsStore(client)
+    loader = threading.Thread(target=store.load_all)
+    loader.start()
+    while client.selects == 0:
+        time.sleep(0.01)
+    # الجلب قرأ 60 قبل هذه الكتابة
+    assert store.set("threshold", 75)
+    release.set()
+    loader.join()
+
+    assert store.get("threshold") == 75
+    assert store.get("theme") == "dark"
+    assert client.selects == 1
+
+
+def test_load_started_before_invalidate_does_not_count_as_fresh():
+    release = threading.Event()
+    client = StubClient({"threshold": 60}, release=release)
+    store = SettingsStore(client)
+    loader = threading.Thread(target=store.load_all)
+    loader.start()
+    while client.selects == 0:
+        time.sleep(0.01)
+    store.invalidate()
+    release.set()
+    loader.join()
+
+    client.release = None
+    store.get("threshold")
+    assert client.selects == 2
@@ -0,0 +1,54 @@
+"""
+test_token_index.py
+حد الندرة في كتالوج منافس صغير، وحذف الفهارس المحفوظة القديمة/الزائدة عن الحجم
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import token_index  # noqa: E402
+from token_index import TokenIndex, get_or_build_index  # noqa: E402
+
+SMALL_CATALOG = ["عطر ديور سوفاج 100 مل", "عطر شانيل بلو 100 مل", "عطر كريد افينتوس 100 مل",
+                 "عطر توم فورد عود وود 50 مل", "عطر غوتشي بلوم 50 مل"]
+
+
+def test_small_catalog_has_rare_tokens():
+    index = TokenIndex(SMALL_CATALOG, max_df_ratio=0.05)  # 5 صفوف < 1/0.05
+    assert index.report()["rare_tokens"] > 0
+    assert index.candidates("سوفاج ديور 100 مل") == [0]
+    assert index.stats["rare_fallbacks"] == 0
+    # الكلمات المشتركة بين كل الصفوف تبقى غير نادرة
+    assert index.idf["عطر"] < index.min_idf
+
+
+def test_cached_index_gets_current_threshold(tmp_path):
+    index = TokenIndex(SMALL_CATALOG)
+    index.min_idf = 3.0  # كما حُفظ قبل تعديل الحد
+    path = str(tmp_path / "old.pkl")
+    index.save(path)
+    assert TokenIndex.load(path).min_idf == TokenIndex(SMALL_CATALOG).min_idf
+
+
+def test_evict_by_age_then_size(tmp_path):
+    now = time.time()
+    for name, age_days in (("old", 40), ("a", 3), ("b", 2), ("c", 1)):
+        path = tmp_path / f"{name}.pkl"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (now - age_days * 86400, now - age_days * 86400))
+    token_index.evict(str(tmp_path), max_bytes=250, max_age=30 * 86400)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.pkl", "c.pkl"]
+
+
+def test_get_or_build_touches_and_evicts(tmp_path):
+    cache_dir = str(tmp_path)
+    get_or_build_index(SMALL_CATALOG, cache_dir=cache_dir)
+    stale = tmp_path / "stale.pkl"
+    stale.write_bytes(b"x")
+    os.utime(stale, (0, 0))
+    get_or_build_index(SMALL_CATALOG[:3], cache_dir=cache_dir)
+    assert not stale.exists()
+    assert len(list(tmp_path.glob("*.pkl"))) == 2
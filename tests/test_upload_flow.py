@@ -0,0 +1,134 @@
+"""
+test_upload_flow.py
+مسار صفحة الرفع كاملاً على ملفات صغيرة: ملفات {"name", "data"} -> run_full_analysis -> build_result_sections
+(الذكاء الاصطناعي وSupabase ببدائل محلية، والحالة المحلية في مجلد مؤقت)
+"""
+
+import os
+import sys
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("rapidfuzz")
+pytest.importorskip("streamlit")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STORE = pd.DataFrame({
+    "name": ["Dior Sauvage EDP 100ml", "Chanel Bleu EDT 100ml", "Creed Aventus EDP 100ml", "Gucci Bloom EDP 50ml"],
+    "price": [500, 450, 1200, 300],
+})
+COMPETITOR_A = pd.DataFrame({
+    "name": ["DIOR Sauvage Eau de Parfum 100 ml", "Chanel Bleu EDT 100ml", "Creed Aventus EDP 100ml",
+             "Tom Ford Oud Wood EDP 50ml"],
+    "price": [550, 400, 1200, 900],
+})
+COMPETITOR_B = pd.DataFrame({
+    "name": ["Dior Sauvage Eau de Parfum 100ml", "Tom Ford Oud Wood EDP 50ml"],
+    "price": [520, 850],
+})
+
+
+class NullDatabase:
+    def __init__(self):
+        self.active = False
+
+    def get_session_id(self):
+        return "test"
+
+    def save_match(self, *args):
+        pass
+
+    def flush(self):
+        return 0
+
+    def close(self):
+        return None
+
+
+def _upload(name, df):
+    return {"name": name, "data": df.to_csv(index=False).encode("utf-8")}
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    import ai_cache
+    import local_store
+    import upload_cache
+    monkeypatch.setenv("LOCAL_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(local_store, "DB_PATH", str(tmp_path / "local_store.db"))
+    monkeypatch.setattr(upload_cache, "UPLOAD_CACHE_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(ai_cache, "_pair_cache", None)
+    import engine_v15
+    monkeypatch.setattr(engine_v15, "DatabaseManager", NullDatabase)
+    monkeypatch.setattr(engine_v15, "_ai_chat", lambda *a, **k: None)  # لا رد من الذكاء الاصطناعي
+    return engine_v15
+
+
+def test_upload_path_builds_page_sections(engine):
+    progress = []
+    df = engine.run_full_analysis(_upload("store.csv", STORE),
+                                  [_upload("a.csv", COMPETITOR_A), _upload("b.csv", COMPETITOR_B)],
+                                  threshold=60, incremental_scope="upload",
+                                  progress_callback=lambda percent, message, profile=None: progress.append(percent))
+    results = engine.build_result_sections(df)
+
+    assert set(results) >= {"raise", "lower", "approved", "review", "missing", "all", "stats"}
+    stats = results["stats"]
+    assert stats["competitors"] == 2
+    assert stats["total"] == (stats["raise_count"] + stats["lower_count"] + stats["approved_count"]
+                              + stats["unverified_count"])
+
+    names = lambda key: set(results[key]["المنتج"]) if not results[key].empty else set()  # noqa: E731
+    assert "Dior Sauvage EDP 100ml" in names("raise")      # أرخص منافس 520 > 500
+    assert "Chanel Bleu EDT 100ml" in names("lower")        # 400 < 450
+    assert "Creed Aventus EDP 100ml" in names("approved")   # نفس السعر
+    assert "Gucci Bloom EDP 50ml" not in names("raise") | names("lower") | names("approved")
+
+    missing = results["missing"]
+    assert len(missing) == 1 and stats["missing_count"] == 1
+    assert "Oud Wood" in missing.iloc[0]["المنتج"] and missing.iloc[0]["السعر"] == 850
+
+    for key in ("raise", "lower", "approved"):
+        for column in ("السعر", "أقل سعر منافس", "الفرق", "النسبة %", "الخطورة"):
+            assert results[key].empty or column in results[key].columns
+    assert len(results["all"]) == stats["total"]
+    assert progress and all(isinstance(p, int) for p in progress)
+
+
+def test_sections_are_savable_as_rows(engine):
+    from results_store import save_run_rows
+
+    class Recorder:
+        def __init__(self):
+            self.rows = []
+
+        def upsert(self, table, rows, on_conflict=None, returning="representation"):
+            assert returning == "minimal"
+            self.rows.extend(rows)
+            return type("R", (), {"raise_for_status": lambda self: None})()
+
+    df = engine.run_full_analysis(_upload("store.csv", STORE), [_upload("a.csv", COMPETITOR_A)], threshold=60)
+    results = engine.build_result_sections(df)
+    client = Recorder()
+    saved = save_run_rows(client, 1, results)
+    assert saved == sum(len(results[k]) for k in ("raise", "lower", "approved", "missing", "review"))
+    assert {row["section"] for row in client.rows} <= {"raise", "lower", "approved", "missing", "review"}
+
+
+@pytest.mark.parametrize("multi", [False, True])
+def test_unverified_borderline_goes_to_review(engine, multi):
+    store = pd.DataFrame({"name": ["Armani Code EDT 75ml"], "price": [300]})
+    comp = pd.DataFrame({"name": ["Armani Code Profumo EDT 75ml"], "price": [350]})  # ثقة 60..85: تحتاج تحقق
+    messages = []
+    df = engine.run_full_analysis(store, [_upload("a.csv", comp)] if multi else comp, threshold=60,
+                                  progress_callback=lambda percent, message, profile=None: messages.append(message))
+    results = engine.build_result_sections(df)
+
+    assert results["stats"]["unverified_count"] == 1
+    assert results["raise"].empty and results["lower"].empty  # الذكاء الاصطناعي لم يرد: لا قرار سعر
+    review = results["review"]
+    assert len(review) == 1 and review.iloc[0]["الخطورة"] == "غير متحقق"
+    assert review.iloc[0]["تفسير_AI"] == "لم يتم التحقق"
+    assert any("لم يتم التحقق" in m for m in messages)
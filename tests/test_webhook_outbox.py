@@ -0,0 +1,90 @@
+"""
+test_webhook_outbox.py
+الصندوق الصادر مقابل webhook محلي بديل (benchmarks/webhook.py): مفتاح Idempotency-Key لكل دفعة،
+إعادة إرسال الدفعة الفاشلة بنفس مفتاحها، وتراجع AIMD عند 429 ثم زيادته بعد النجاح
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+pytest.importorskip("requests")
+
+import webhook_outbox  # noqa: E402
+from aimd import AIMDController  # noqa: E402
+from webhook import StubWebhook  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    stub = StubWebhook(capacity=100000, max_inflight=8, base_latency=0.01, per_item=0.0)
+    yield stub
+    stub.close()
+
+
+def _outbox(tmp_path, controller):
+    box = webhook_outbox.Outbox(path=str(tmp_path / "outbox.db"), controller=controller,
+                                workers=controller.max_concurrency)
+    box.register_target("stub", lambda items: {"products": items})
+    box.start()
+    return box
+
+
+def test_each_batch_has_its_own_idempotency_key(tmp_path, stub):
+    box = _outbox(tmp_path, AIMDController(max_concurrency=4, min_batch=10, max_batch=10, batch_size=10))
+    job_id = box.enqueue("test", "مفاتيح", "stub", stub.url, [{"id": i} for i in range(100)])
+    status = box.wait(job_id, 20)
+
+    assert status["done"] and status["sent"] == 100 and status["failed"] == 0
+    assert status["batches"] == 10
+    assert len(stub.keys) == 10 and stub.accepted == 100
+
+
+def test_failed_batch_is_retried_with_same_key(tmp_path, stub, monkeypatch):
+    monkeypatch.setattr(webhook_outbox, "MAX_THROTTLED", 1)  # أول 429 = فشل نهائي
+    box = _outbox(tmp_path, AIMDController(max_concurrency=1, concurrency=1, min_batch=10, max_batch=10,
+                                           batch_size=10))
+    stub.max_inflight = 0  # كل الطلبات 429
+    job_id = box.enqueue("test", "إعادة", "stub", stub.url, [{"id": i} for i in range(10)])
+    status = box.wait(job_id, 20)
+    assert status["done"] and status["failed"] == 10 and stub.accepted == 0
+    keys = {key for key, in box.conn.execute("SELECT idempotency_key FROM outbox_batches WHERE job_id = ?", (job_id,))}
+
+    stub.max_inflight = 8
+    assert box.retry_failed(job_id) == 1
+    status = box.wait(job_id, 20)
+    assert status["done"] and status["sent"] == 10 and status["failed"] == 0
+    assert stub.accepted == 10 and stub.keys == keys
+
+
+def test_aimd_backs_off_on_429_then_grows(tmp_path, stub):
+    controller = AIMDController(max_concurrency=8, concurrency=8, min_batch=10, max_batch=10, batch_size=10)
+    trace = []  # (429؟، التزامن بعد الرد)
+    record = controller.record
+    lock = threading.Lock()
+
+    def traced(ok, latency, items=0, throttled=False, retry_after=None):
+        record(ok, latency, items, throttled=throttled, retry_after=retry_after)
+        with lock:
+            trace.append((throttled, controller.concurrency))
+    controller.record = traced
+
+    stub.max_inflight = 2  # 8 طلبات متزامنة على خادم يقبل 2
+    box = _outbox(tmp_path, controller)
+    job_id = box.enqueue("test", "AIMD", "stub", stub.url, [{"id": i} for i in range(120)])
+    status = box.wait(job_id, 60)
+
+    assert status["done"] and status["sent"] == 120 and stub.accepted == 120
+    assert stub.throttled > 0
+    first_429 = next(n for n, (throttled, _) in enumerate(trace) if throttled)
+    low = min(c for _, c in trace[first_429:])
+    assert low < 8
+    # بعد أدنى نقطة تعود الزيادة الجمعية مع الردود الناجحة
+    bottom = next(n for n, (_, c) in enumerate(trace) if c == low)
+    assert any(c > low for _, c in trace[bottom:])
@@ -0,0 +1,170 @@
+"""
+token_index.py
+فهرس مقلوب على كلمات أسماء المنافسين مع أوزان IDF لتقليص المرشحين قبل المطابقة
+"""
+
+import hashlib
+import heapq
+import math
+import os
+import pickle
+import re
+import time
+from collections import defaultdict
+
+from local_store import CACHE_DIR
+
+INDEX_CACHE_DIR = os.path.join(CACHE_DIR, "token_index")
+MAX_CACHE_BYTES = 512 * 1024 ** 2  # 512MB كحد أقصى قبل حذف الأقدم استخداماً
+MAX_CACHE_AGE = 30 * 86400         # فهرس لم يُستخدم منذ 30 يوماً يُحذف
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _min_idf(total, max_df_ratio):
+    """حد الندرة: الكلمة نادرة إذا ظهرت في max_df_ratio من الصفوف على الأكثر (أو في صف واحد)
+
+    بدون الحد الأدنى (صف واحد) لا تبلغ أي كلمة الحد في كتالوج أصغر من 1/max_df_ratio صفاً
+    """
+    if max_df_ratio >= 1:
+        return 0.0
+    return math.log(total / max(1.0, max_df_ratio * total)) if total > 0 else 0.0
+
+
+def tokenize(name):
+    """تقسيم الاسم إلى كلمات فريدة (بدون تكرار)"""
+    return list(dict.fromkeys(_TOKEN_RE.findall(str(name).lower())))
+
+
+class TokenIndex:
+    """فهرس مقلوب: كلمة ← أرقام صفوف المنافسين التي تحتويها.
+
+    الكلمات الشائعة (مثل "عطر" و"تستر") لا تولّد مرشحين، فقط الكلمات النادرة
+    التي تظهر في أقل من max_df_ratio من الصفوف.
+    """
+
+    def __init__(self, names, max_candidates=200, max_df_ratio=0.05):
+        self.max_candidates = max_candidates
+        self.max_df_ratio = max_df_ratio
+        self.names = [str(n) for n in names]
+        self.signature = self.compute_signature(self.names)
+
+        postings = defaultdict(list)
+        for row_id, name in enumerate(self.names):
+            for token in tokenize(name):
+                postings[token].append(row_id)
+        self.postings = dict(postings)
+
+        total = max(len(self.names), 1)
+        self.idf = {t: math.log(total / len(ids)) for t, ids in self.postings.items()}
+        # حد الندرة: الكلمة نادرة إذا كان IDF أكبر من أو يساوي هذه القيمة
+        self.min_idf = _min_idf(len(self.names), max_df_ratio)
+        self.reset_stats()
+
+    @staticmethod
+    def compute_signature(names):
+        """بصمة محتوى الأسماء لإعادة استخدام الفهرس المحفوظ"""
+        digest = hashlib.sha1()
+        for name in names:
+            digest.update(str(name).encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def reset_stats(self):
+        self.stats = {"queries": 0, "hits": 0, "candidates": 0, "rare_fallbacks": 0, "empty": 0}
+
+    def candidates(self, name):
+        """أرقام صفوف المرشحين مرتبة حسب مجموع IDF للكلمات المشتركة (بحد أقصى max_candidates)"""
+        self.stats["queries"] += 1
+        tokens = [t for t in tokenize(name) if t in self.postings]
+        rare = [t for t in tokens if self.idf[t] >= self.min_idf]
+        if not rare and tokens:
+            # لا توجد كلمة نادرة: نكتفي بأندر كلمة متاحة
+            rare = [max(tokens, key=lambda t: self.idf[t])]
+            self.stats["rare_fallbacks"] += 1
+        if not rare:
+            self.stats["empty"] += 1
+            return []
+
+        weights = defaultdict(float)
+        for token in rare:
+            w = self.idf[token]
+            for row_id in self.postings[token]:
+                weights[row_id] += w
+
+        if len(weights) > self.max_candidates:
+            ranked = heapq.nlargest(self.max_candidates, weights.items(), key=lambda kv: (kv[1], -kv[0]))
+        else:
+            ranked = sorted(weights.items(), key=lambda kv: (-kv[1], kv[0]))
+        self.stats["hits"] += 1
+        self.stats["candidates"] += len(ranked)
+        return [row_id for row_id, _ in ranked]
+
+    def report(self):
+        """ملخص أداء الفهرس لضبط max_candidates و max_df_ratio"""
+        q = max(self.stats["queries"], 1)
+        return {
+            **self.stats,
+            "rows": len(self.names),
+            "tokens": len(self.postings),
+            "rare_tokens": sum(1 for v in self.idf.values() if v >= self.min_idf),
+            "avg_candidates": round(self.stats["candidates"] / q, 1),
+            "hit_rate": round(self.stats["hits"] / q * 100, 1),
+        }
+
+    # ── الحفظ والتحميل من القرص ──────────────────────────────
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            index = pickle.load(f)
+        index.min_idf = _min_idf(len(index.names), index.max_df_ratio)  # فهارس محفوظة قبل تعديل الحد
+        index.reset_stats()
+        return index
+
+
+def get_or_build_index(names, max_candidates=200, max_df_ratio=0.05, cache_dir=INDEX_CACHE_DIR):
+    """تحميل الفهرس المحفوظ لنفس الأسماء أو بناؤه وحفظه"""
+    names = [str(n) for n in names]
+    signature = TokenIndex.compute_signature(names)
+    path = os.path.join(cache_dir, f"{signature}_{max_df_ratio}.pkl")
+    if os.path.exists(path):
+        try:
+            index = TokenIndex.load(path)
+            index.max_candidates = max_candidates
+            os.utime(path)  # وقت الاستخدام لترتيب الحذف
+            return index
+        except Exception:
+            pass  # ملف تالف: نعيد البناء
+    index = TokenIndex(names, max_candidates=max_candidates, max_df_ratio=max_df_ratio)
+    try:
+        index.save(path)
+    except OSError:
+        pass  # فشل الحفظ لا يمنع المطابقة
+    evict(cache_dir)
+    return index
+
+
+def evict(cache_dir=INDEX_CACHE_DIR, max_bytes=MAX_CACHE_BYTES, max_age=MAX_CACHE_AGE):
+    """حذف الفهارس غير المستخدمة منذ max_age ثانية، ثم الأقدم استخداماً حتى يصبح الحجم ضمن الحد"""
+    try:
+        entries = [e for e in os.scandir(cache_dir) if e.name.endswith(".pkl")]
+    except FileNotFoundError:
+        return
+    entries = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries))
+    total = sum(size for _, size, _ in entries)
+    cutoff = time.time() - max_age
+    for mtime, size, path in entries:
+        if total <= max_bytes and mtime >= cutoff:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,109 @@
+"""
+upload_cache.py
+ذاكرة مؤقتة للملفات المرفوعة بعد تحليلها: ملف Parquet لكل ملف مرفوع بمفتاح SHA-256 لمحتواه
+إعادة رفع نفس الملف تتخطى قراءة Excel بالكامل
+"""
+
+import hashlib
+import os
+import uuid
+
+from local_store import CACHE_DIR
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+UPLOAD_CACHE_DIR = os.path.join(CACHE_DIR, "uploads")
+MAX_CACHE_BYTES = 2 * 1024 ** 3  # 2GB كحد أقصى قبل حذف الأقدم استخداماً
+
+if PARQUET_AVAILABLE:
+    _SCHEMA = pa.schema([("name", pa.string()), ("price", pa.float64()), ("sku", pa.string())])
+
+
+def file_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _path(digest):
+    return os.path.join(UPLOAD_CACHE_DIR, f"{digest}.parquet")
+
+
+def lookup(digest):
+    """مسار الملف المحفوظ (مع تحديث وقت الاستخدام) أو None"""
+    path = _path(digest)
+    if not os.path.exists(path):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return path
+
+
+def read_batches(path, chunk_size):
+    """دفعات من (name, price, sku) من ملف Parquet محفوظ"""
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=chunk_size):
+        cols = batch.to_pydict()
+        yield list(zip(cols["name"], cols["price"], cols["sku"]))
+
+
+class CacheWriter:
+    """كتابة السجلات المحللة تدريجياً؛ لا يظهر الملف في الذاكرة المؤقتة إلا بعد commit"""
+
+    def __init__(self, digest):
+        os.makedirs(UPLOAD_CACHE_DIR, exist_ok=True)
+        self.digest = digest
+        self.tmp_path = os.path.join(UPLOAD_CACHE_DIR, f".{digest}.{uuid.uuid4().hex[:8]}.tmp")
+        self.writer = pq.ParquetWriter(self.tmp_path, _SCHEMA, compression="zstd")
+        self.done = False
+
+    def write(self, records):
+        if not records:
+            return
+        self.writer.write_table(pa.table({
+            "name": [r.name for r in records],
+            "price": [float(r.price) for r in records],
+            "sku": [r.sku for r in records],
+        }, schema=_SCHEMA))
+
+    def commit(self):
+        self.writer.close()
+        os.replace(self.tmp_path, _path(self.digest))
+        self.done = True
+        evict()
+
+    def abort(self):
+        """حذف الملف المؤقت إذا لم تكتمل القراءة"""
+        if self.done:
+            return
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+def evict(max_bytes=MAX_CACHE_BYTES):
+    """حذف الملفات الأقدم استخداماً حتى يصبح الحجم الكلي ضمن الحد"""
+    try:
+        entries = [e for e in os.scandir(UPLOAD_CACHE_DIR) if e.name.endswith(".parquet")]
+    except FileNotFoundError:
+        return
+    entries = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,386 @@
+"""
+webhook_outbox.py
+صندوق صادر محلي دائم (SQLite) لإرسال الدفعات إلى Make.com:
+كل دفعة تُحفظ قبل الإرسال، وعمال في الخلفية يرسلون عدة دفعات بالتوازي مع إعادة المحاولة
+ومفتاح Idempotency-Key ثابت لكل دفعة؛ الواجهة تقرأ حالة المهمة فقط فلا يتأثر الإرسال بإغلاق المتصفح
+
+المنتجات تُحفظ فرادى وتُقسَّم إلى دفعات لحظة الإرسال بحجم يحدده AIMDController، وعدد الطلبات
+المتزامنة يتبع نفس المتحكم (aimd.py)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import local_store
+from aimd import AIMDController, MAX_CONCURRENCY
+from rate_limit import parse_retry_after
+
+DEFAULT_WORKERS = int(os.environ.get("OUTBOX_WORKERS", str(MAX_CONCURRENCY)))  # سقف التزامن؛ الحد الفعلي من AIMD
+MAX_ATTEMPTS = 5        # أخطاء الخادم والشبكة
+MAX_THROTTLED = 30      # ردود 429: ضغط عكسي وليس فشلاً، فلها حد أعلى
+BASE_BACKOFF = 2.0      # ثوانٍ: 2، 4، 8 ...
+MAX_BACKOFF = 60.0
+TIMEOUT = 60
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+# أخطاء نقل مؤقتة تستحق إعادة المحاولة؛ بقية RequestException (رابط خاطئ، تحويلات كثيرة...) فشل نهائي
+RETRY_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox_jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    label TEXT NOT NULL,
+    total_items INTEGER NOT NULL,
+    meta_json TEXT NOT NULL,
+    target TEXT,
+    url TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS outbox_batches (
+    job_id TEXT NOT NULL,
+    batch_no INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    payload_json TEXT NOT NULL,
+    items_json TEXT NOT NULL,
+    items INTEGER NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    throttles INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, batch_no)
+);
+CREATE INDEX IF NOT EXISTS outbox_batches_due ON outbox_batches (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS outbox_items (
+    job_id TEXT NOT NULL,
+    item_no INTEGER NOT NULL,
+    item_json TEXT NOT NULL,
+    PRIMARY KEY (job_id, item_no)
+);
+"""
+
+
+def _json_default(obj):
+    return obj.item() if hasattr(obj, "item") else str(obj)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, default=_json_default)
+
+
+class Outbox:
+    """مهام الإرسال ودفعاتها في SQLite + عمال خلفيون يرسلون الدفعات المستحقة"""
+
+    def __init__(self, path=None, workers=DEFAULT_WORKERS, max_attempts=MAX_ATTEMPTS, timeout=TIMEOUT,
+                 controller=None):
+        self.conn = local_store.connect(path)
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.controller = controller or AIMDController(max_concurrency=max(1, workers))
+        self.handlers = {}
+        self.targets = {}
+        # العمال الخاملون ينتظرون هنا حتى enqueue/retry_failed/register_target أو موعد أقرب إعادة محاولة
+        self.changed = threading.Condition(self.lock)
+        self.generation = 0
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # دفعات كانت قيد الإرسال عند توقف العملية تعود للطابور (المفتاح الثابت يمنع التكرار عند المستقبل)
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE outbox_batches SET status = 'pending' WHERE status = 'sending'")
+        self.workers = max(1, workers)
+        self.threads = []
+
+    def start(self):
+        """تشغيل العمال (مرة واحدة)؛ بعد register حتى تجد الدفعات المستأنفة معالجاتها"""
+        with self.lock:
+            if self.threads:
+                return
+            self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for t in self.threads:
+            t.start()
+
+    def register(self, kind, on_batch_sent=None, on_job_done=None):
+        """معالجات تُستدعى من خيوط العمال (بدون st.*):
+        on_batch_sent(job, items) بعد نجاح كل دفعة، on_job_done(job, status) عند انتهاء المهمة
+        """
+        self.handlers[kind] = (on_batch_sent, on_job_done)
+
+    def register_target(self, target, build_payload):
+        """build_payload(items) -> جسم الطلب؛ يُستدعى عند تكوين كل دفعة بالحجم الحالي"""
+        self.targets[target] = build_payload
+        self._notify()
+
+    def enqueue(self, kind, label, target, url, items, meta=None):
+        """حفظ مهمة جديدة بمنتجاتها فرادى؛ التقسيم إلى دفعات يتم لحظة الإرسال"""
+        job_id = uuid.uuid4().hex[:12]
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO outbox_jobs (job_id, kind, label, total_items, meta_json, created_at, target, url) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, label, len(items), _dumps(meta or {}), time.time(), target, url))
+            self.conn.executemany("INSERT INTO outbox_items (job_id, item_no, item_json) VALUES (?, ?, ?)",
+                                  [(job_id, n, _dumps(item)) for n, item in enumerate(items)])
+        self._notify()
+        return job_id
+
+    def _notify(self):
+        with self.changed:
+            self.generation += 1
+            self.changed.notify_all()
+
+    def _idle(self, seen):
+        """انتظار عمل جديد بعد generation=seen؛ المهلة حتى أقرب دفعة مؤجلة (بدون استطلاع دوري)"""
+        with self.changed:
+            if self.generation != seen:
+                return
+            due = self.conn.execute(
+                "SELECT min(next_attempt_at) FROM outbox_batches WHERE status = 'pending'").fetchone()[0]
+            self.changed.wait(None if due is None else max(0.0, due - time.time()))
+
+    def _claim(self, batch_size):
+        """دفعة للإرسال تُعلَّم sending داخل القفل فلا يأخذها عاملان:
+        أولاً دفعة مستحقة لإعادة المحاولة (بنفس جسمها ومفتاحها)، وإلا دفعة جديدة بحجم batch_size
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT job_id, batch_no, url, payload_json, idempotency_key, attempts, items, throttles FROM outbox_batches "
+                "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY updated_at, batch_no LIMIT 1",
+                (now,)).fetchone()
+            if row:
+                self.conn.execute("UPDATE outbox_batches SET status = 'sending' WHERE job_id = ? AND batch_no = ?",
+                                  row[:2])
+                return row
+            if not self.targets:
+                return None
+            marks = ", ".join("?" * len(self.targets))
+            job = self.conn.execute(
+                f"SELECT j.job_id, j.url, j.target FROM outbox_jobs j WHERE j.target IN ({marks}) AND EXISTS "
+                "(SELECT 1 FROM outbox_items i WHERE i.job_id = j.job_id) ORDER BY j.created_at LIMIT 1",
+                list(self.targets)).fetchone()
+            if not job:
+                return None
+            job_id, url, target = job
+            picked = self.conn.execute(
+                "SELECT item_no, item_json FROM outbox_items WHERE job_id = ? ORDER BY item_no LIMIT ?",
+                (job_id, batch_size)).fetchall()
+            items = [json.loads(item_json) for _, item_json in picked]
+            batch_no = self.conn.execute(
+                "SELECT coalesce(max(batch_no) + 1, 0) FROM outbox_batches WHERE job_id = ?", (job_id,)).fetchone()[0]
+            key = hashlib.sha1(f"{job_id}:{batch_no}".encode()).hexdigest()
+            try:
+                payload_json, status, error = _dumps(self.targets[target](items)), "sending", None
+            except Exception as e:
+                # حالة نهائية: retry_failed لا يعيدها، ولا يُرسل جسم بديل أبداً
+                payload_json, status, error = "", "invalid", f"payload: {e}"[:200]
+            self.conn.execute(
+                "INSERT INTO outbox_batches (job_id, batch_no, url, payload_json, items_json, items, idempotency_key, "
+                "status, last_error, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, batch_no, url, payload_json, _dumps(items), len(items), key, status, error, now))
+            self.conn.execute("DELETE FROM outbox_items WHERE job_id = ? AND item_no <= ?", (job_id, picked[-1][0]))
+            if status == "invalid":
+                payload_json = None
+            return job_id, batch_no, url, payload_json, key, 0, len(items), 0
+
+    def _send(self, url, payload_json, key):
+        """(نجح؟، قابل لإعادة المحاولة؟، انتظار مقترح، الخطأ، رمز HTTP)"""
+        try:
+            r = self.session.post(url, data=payload_json.encode("utf-8"), timeout=self.timeout,
+                                  headers={"Content-Type": "application/json", "Idempotency-Key": key})
+        except RETRY_ERRORS as e:
+            return False, True, None, str(e)[:200], None
+        except requests.exceptions.RequestException as e:
+            return False, False, None, f"{type(e).__name__}: {e}"[:200], None
+        if 200 <= r.status_code < 300:
+            return True, False, None, None, r.status_code
+        return (False, r.status_code in RETRY_STATUSES, parse_retry_after(r.headers.get("Retry-After")),
+                f"HTTP {r.status_code}: {r.text[:200]}", r.status_code)
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                seen = self.generation
+            with self.controller.slot():
+                row = self._claim(self.controller.batch_size)
+                if row is not None:
+                    try:
+                        self._deliver(row)
+                    except Exception as e:
+                        self._fail(row[0], row[1], f"{type(e).__name__}: {e}"[:200])
+            if row is None:
+                self._idle(seen)
+
+    def _deliver(self, row):
+        job_id, batch_no, url, payload_json, key, attempts, items, throttles = row
+        if not payload_json:
+            self._finish_if_done(job_id)  # تعذر بناء جسم الدفعة فسُجلت invalid
+            return
+        start = time.monotonic()
+        ok, retry, retry_after, error, code = self._send(url, payload_json, key)
+        self.controller.record(ok, time.monotonic() - start, items, throttled=retry, retry_after=retry_after)
+        if code == 429:
+            throttles += 1
+        else:
+            attempts += 1
+        if ok:
+            status, next_at = "sent", 0
+        elif retry and attempts < self.max_attempts and throttles < MAX_THROTTLED:
+            status = "pending"
+            next_at = time.time() + (retry_after if retry_after is not None
+                                     else min(MAX_BACKOFF, BASE_BACKOFF * 2 ** max(attempts - 1, throttles - 1, 0)))
+        else:
+            status, next_at = "failed", 0
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE outbox_batches SET status = ?, attempts = ?, throttles = ?, next_attempt_at = ?, "
+                "last_error = ?, updated_at = ? WHERE job_id = ? AND batch_no = ?",
+                (status, attempts, throttles, next_at, error, time.time(), job_id, batch_no))
+        if ok:
+            self._run_handler(job_id, 0, batch_no)
+        if status == "pending":
+            self._notify()  # العمال الخاملون يعيدون حساب موعد الاستيقاظ
+        else:
+            self._finish_if_done(job_id)
+
+    def _fail(self, job_id, batch_no, error):
+        """خطأ غير متوقع أثناء الإرسال: الدفعة failed (قابلة لـ retry_failed) بدل بقائها sending للأبد"""
+        try:
+            with self.lock, self.conn:
+                self.conn.execute(
+                    "UPDATE outbox_batches SET status = 'failed', last_error = ?, updated_at = ? "
+                    "WHERE job_id = ? AND batch_no = ? AND status = 'sending'",
+                    (error, time.time(), job_id, batch_no))
+            self._finish_if_done(job_id)
+        except Exception:
+            pass  # العامل يبقى حياً في كل الأحوال
+
+    def _run_handler(self, job_id, index, batch_no=None):
+        job = self.job(job_id)
+        handler = self.handlers.get(job["kind"], (None, None))[index] if job else None
+        if not handler:
+            return
+        try:
+            if index == 0:
+                with self.lock:
+                    items = json.loads(self.conn.execute(
+                        "SELECT items_json FROM outbox_batches WHERE job_id = ? AND batch_no = ?",
+                        (job_id, batch_no)).fetchone()[0])
+                handler(job, items)
+            else:
+                handler(job, self.status(job_id))
+        except Exception:
+            pass  # فشل التسجيل لا يوقف الإرسال
+
+    def _finish_if_done(self, job_id):
+        """تعليم المهمة منتهية مرة واحدة فقط ثم استدعاء on_job_done"""
+        with self.lock, self.conn:
+            busy = self.conn.execute(
+                "SELECT 1 FROM outbox_batches WHERE job_id = ? AND status IN ('pending', 'sending') "
+                "UNION ALL SELECT 1 FROM outbox_items WHERE job_id = ? LIMIT 1",
+                (job_id, job_id)).fetchone()
+            if busy:
+                return
+            finished = self.conn.execute(
+                "UPDATE outbox_jobs SET finished_at = ? WHERE job_id = ? AND finished_at IS NULL",
+                (time.time(), job_id)).rowcount
+        if finished:
+            self._run_handler(job_id, 1)
+
+    def job(self, job_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT job_id, kind, label, total_items, meta_json, created_at, finished_at FROM outbox_jobs "
+                "WHERE job_id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        return {"job_id": row[0], "kind": row[1], "label": row[2], "total_items": row[3],
+                "meta": json.loads(row[4]), "created_at": row[5], "finished_at": row[6]}
+
+    def status(self, job_id):
+        """حالة المهمة للواجهة: أعداد الدفعات والمنتجات لكل حالة + آخر خطأ"""
+        job = self.job(job_id)
+        if not job:
+            return None
+        with self.lock:
+            counts = self.conn.execute(
+                "SELECT status, count(*), sum(items) FROM outbox_batches WHERE job_id = ? GROUP BY status",
+                (job_id,)).fetchall()
+            queued = self.conn.execute("SELECT count(*) FROM outbox_items WHERE job_id = ?", (job_id,)).fetchone()[0]
+            last_error = self.conn.execute(
+                "SELECT last_error FROM outbox_batches WHERE job_id = ? AND last_error IS NOT NULL "
+                "ORDER BY updated_at DESC LIMIT 1", (job_id,)).fetchone()
+        by_status = {s: (n, items or 0) for s, n, items in counts}
+        sent = by_status.get("sent", (0, 0))
+        failed = tuple(a + b for a, b in zip(by_status.get("failed", (0, 0)), by_status.get("invalid", (0, 0))))
+        pending = tuple(a + b for a, b in zip(by_status.get("pending", (0, 0)), by_status.get("sending", (0, 0))))
+        end = job["finished_at"] or time.time()
+        elapsed = end - job["created_at"]
+        return {
+            **job,
+            "batches": sum(n for n, _ in by_status.values()),
+            "sent_batches": sent[0], "failed_batches": failed[0], "pending_batches": pending[0],
+            "sent": sent[1], "failed": failed[1], "pending": pending[1] + queued,
+            "done": job["finished_at"] is not None,
+            "elapsed": round(elapsed, 1),
+            "rate": round(sent[1] / elapsed, 1) if elapsed > 0 else 0.0,
+            "last_error": last_error[0] if last_error else None,
+        }
+
+    def wait(self, job_id, timeout):
+        """انتظار انتهاء المهمة حتى timeout ثانية؛ يعيد آخر حالة"""
+        deadline = time.monotonic() + timeout
+        while True:
+            status = self.status(job_id)
+            if status is None or status["done"] or time.monotonic() >= deadline:
+                return status
+            time.sleep(0.2)
+
+    def retry_failed(self, job_id):
+        """إعادة الدفعات الفاشلة للطابور (بنفس مفاتيح Idempotency-Key)؛ دفعات invalid لا تُعاد"""
+        with self.lock, self.conn:
+            count = self.conn.execute(
+                "UPDATE outbox_batches SET status = 'pending', attempts = 0, throttles = 0, next_attempt_at = 0, "
+                "updated_at = ? "
+                "WHERE job_id = ? AND status = 'failed'", (time.time(), job_id)).rowcount
+            if count:
+                self.conn.execute("UPDATE outbox_jobs SET finished_at = NULL WHERE job_id = ?", (job_id,))
+        self._notify()
+        return count
+
+    def snapshot(self):
+        """حالة المتحكم الحية: التزامن، حجم الدفعة، الطلبات الجارية، منتج/ثانية"""
+        return self.controller.snapshot()
+
+    def recent_jobs(self, limit=10):
+        with self.lock:
+            ids = [r[0] for r in self.conn.execute(
+                "SELECT job_id FROM outbox_jobs ORDER BY created_at DESC LIMIT ?", (limit,))]
+        return [self.status(job_id) for job_id in ids]
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """صندوق صادر واحد لكل العملية (العمال تبدأ بـ start())"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox()
+        return _outbox